@@ -0,0 +1,145 @@
+'''
+Long-lived playback of raw 16-bit mono PCM clips. The sound card is opened
+once, and a thread feeds it each clip from memory in short chunks, so a new
+utterance starts without a player process to spawn, and one still playing
+when a newer command is spoken is cut off at the next chunk.
+
+PyAudio is used when it is installed. Otherwise one aplay process is kept
+running and fed the same way through its stdin, paced close to real time so
+little audio sits in the pipe where it can't be cancelled.
+'''
+import time
+import threading
+import subprocess
+try:
+    import pyaudio
+except ImportError:
+    pyaudio = None
+
+
+class PyAudioSink(object):
+
+    def __init__(self, sample_rate):
+        self.audio = pyaudio.PyAudio()
+        self.stream = self.audio.open(format=pyaudio.paInt16, channels=1, rate=sample_rate, output=True)
+
+    def write(self, chunk, seconds):
+        # blocks until the card has room, which paces playback
+        self.stream.write(chunk)
+
+    def close(self):
+        self.stream.stop_stream()
+        self.stream.close()
+        self.audio.terminate()
+
+
+class AplaySink(object):
+
+    def __init__(self, sample_rate, lead=0.1):
+        self.player = subprocess.Popen(['aplay', '-q', '-t', 'raw', '-f', 'S16_LE', '-c', '1', '-r', str(sample_rate)],
+                                       stdin=subprocess.PIPE)
+        # how far ahead of the card's playback the pipe may get, in seconds
+        self.lead = lead
+        self.queued_until = 0
+
+    def write(self, chunk, seconds):
+        self.player.stdin.write(chunk)
+        self.player.stdin.flush()
+        now = time.time()
+        self.queued_until = max(self.queued_until, now) + seconds
+        if self.queued_until - now > self.lead:
+            time.sleep(self.queued_until - now - self.lead)
+
+    def close(self):
+        self.player.stdin.close()
+        self.player.wait()
+
+
+class AudioPlayer(object):
+
+    def __init__(self, sample_rate=16000, chunk_ms=20):
+        self.sample_rate = sample_rate
+        # bytes of 16-bit mono audio per chunk
+        self.chunk_bytes = int(sample_rate * chunk_ms / 1000) * 2
+        self.sink = None
+        self.cond = threading.Condition()
+        self.running = False
+        self.thread = None
+        # the clip to play next and the Event set once it finished or was cut off
+        self.clip = None
+        self.done = None
+        # bumped by every play() and cancel(), so the feeding thread notices
+        self.generation = 0
+        self.played = 0
+        self.cancelled = 0
+
+    def start(self):
+        self.sink = PyAudioSink(self.sample_rate) if pyaudio is not None else AplaySink(self.sample_rate)
+        self.running = True
+        self.thread = threading.Thread(target=self._loop)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.cancel()
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.thread.join(2)
+        self.sink.close()
+
+    '''
+    Start playing a clip, cutting off the one playing. Returns an Event set
+    once the clip has played or was itself cut off.
+    '''
+    def play(self, audio):
+        done = threading.Event()
+        with self.cond:
+            self._release()
+            self.generation += 1
+            self.clip = audio
+            self.done = done
+            self.cond.notify()
+        return done
+
+    def cancel(self):
+        with self.cond:
+            self._release()
+            self.generation += 1
+            self.clip = None
+
+    '''
+    Finish the pending clip, if any, as cut off. Call with the lock held.
+    '''
+    def _release(self):
+        if self.done is not None and not self.done.is_set():
+            self.cancelled += 1
+            self.done.set()
+        self.done = None
+
+    def _loop(self):
+        while True:
+            with self.cond:
+                while self.running and self.clip is None:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                audio, done, generation = self.clip, self.done, self.generation
+                self.clip = None
+            for offset in range(0, len(audio), self.chunk_bytes):
+                if self.generation != generation:
+                    break
+                chunk = audio[offset:offset + self.chunk_bytes]
+                self.sink.write(chunk, len(chunk) / 2.0 / self.sample_rate)
+            with self.cond:
+                if self.generation == generation:
+                    self.played += 1
+                    done.set()
+                    self.done = None
+
+    def stats(self):
+        return {
+            'played': self.played,
+            'cancelled': self.cancelled
+        }
@@ -0,0 +1,230 @@
+#! /usr/bin/env python
+'''
+Benchmarks the laser/LED detector modes on synthetic 1280x960 frames with a
+red laser dot and one lit green LED at known positions, under varying noise,
+exposure and distractor blobs. No camera or GPIO needed.
+
+Reports frames per second, per-stage time of the full-frame pipeline and
+centroid error against ground truth as JSON. Frames are generated from a
+fixed seed, so reports from different runs (or machines, or commits) can be
+compared with --compare.
+
+    python benchmark_detector.py --output before.json
+    python benchmark_detector.py --compare before.json
+'''
+import argparse
+import json
+import platform
+import time
+import cv2
+import numpy as np
+from laser_detection import (BLUR_KERNEL, LOWER_RED, UPPER_RED, LOWER_GREEN, UPPER_GREEN,
+                             largest_blob)
+from track_laser import LaserTracker
+
+RESOLUTION = (1280, 960)
+
+# name -> (noise sigma, exposure gain, distractor count)
+SCENARIOS = {
+    'clean': (0.0, 1.0, 0),
+    'noisy': (8.0, 1.0, 0),
+    'dark': (2.0, 0.6, 0),
+    'bright': (2.0, 1.4, 0),
+    'distractors': (4.0, 1.0, 6)
+}
+
+DETECTORS = ['full', 'roi', 'pyramid', 'lut', 'yuv']
+
+
+'''
+Generates a sequence of frames: the LED stays put while the laser sweeps
+toward it, as it would while being steered.
+'''
+class SyntheticScene(object):
+
+    def __init__(self, seed, noise, gain, distractors):
+        self.rng = np.random.RandomState(seed)
+        self.noise = noise
+        self.gain = gain
+        width, height = RESOLUTION
+        # dim grey background with a horizontal gradient
+        ramp = np.linspace(40, 90, width).astype(np.uint8)
+        self.background = np.repeat(np.repeat(ramp[np.newaxis, :, np.newaxis], height, 0), 3, 2)
+        self.led = (int(self.rng.randint(200, width - 200)), int(self.rng.randint(200, height - 200)))
+        self.laser_start = np.array([self.rng.randint(100, width - 100), self.rng.randint(100, height - 100)], dtype=float)
+        self.distractors = [self._distractor() for _ in range(distractors)]
+
+    def _distractor(self):
+        width, height = RESOLUTION
+        center = (int(self.rng.randint(0, width)), int(self.rng.randint(0, height)))
+        radius = int(self.rng.randint(2, 5))
+        # small reddish or greenish specks, like reflections
+        color = (60, 60, 200) if self.rng.rand() < 0.5 else (70, 200, 70)
+        return center, radius, color
+
+    def frame(self, index, count):
+        laser = self.laser_start + (np.array(self.led, dtype=float) - self.laser_start) * index / max(count, 1)
+        laser = (int(laser[0]), int(laser[1]))
+        frame = self.background.copy()
+        for center, radius, color in self.distractors:
+            cv2.circle(frame, center, radius, color, -1)
+        cv2.circle(frame, self.led, 14, (80, 255, 80), -1)
+        cv2.circle(frame, laser, 7, (60, 40, 250), -1)
+        if self.gain != 1.0 or self.noise > 0:
+            pixels = frame.astype(np.float32) * self.gain
+            if self.noise > 0:
+                pixels += self.rng.normal(0, self.noise, frame.shape).astype(np.float32)
+            frame = np.clip(pixels, 0, 255).astype(np.uint8)
+        return frame, laser, self.led
+
+
+def error_px(found, truth):
+    if found is None:
+        return None
+    return float(np.hypot(found[0] - truth[0], found[1] - truth[1]))
+
+
+def summarize(values):
+    if not values:
+        return None
+    return {
+        'mean': float(np.mean(values)),
+        'p95': float(np.percentile(values, 95)),
+        'max': float(np.max(values))
+    }
+
+
+'''
+Time each stage of the full-frame pipeline on one frame, in milliseconds
+'''
+def time_stages(frame, stage_times):
+    start = time.time()
+    blurred = cv2.GaussianBlur(frame, BLUR_KERNEL, 0)
+    t_blur = time.time()
+    hsv = cv2.cvtColor(blurred, cv2.COLOR_BGR2HSV)
+    t_convert = time.time()
+    red = cv2.inRange(hsv, LOWER_RED, UPPER_RED)
+    green = cv2.inRange(hsv, LOWER_GREEN, UPPER_GREEN)
+    t_threshold = time.time()
+    red = cv2.dilate(cv2.erode(red, None, iterations=2), None, iterations=2)
+    green = cv2.dilate(cv2.erode(green, None, iterations=2), None, iterations=2)
+    t_morphology = time.time()
+    largest_blob(red)
+    largest_blob(green)
+    t_blobs = time.time()
+    for stage, begin, end in (('blur', start, t_blur), ('convert', t_blur, t_convert),
+                              ('threshold', t_convert, t_threshold),
+                              ('morphology', t_threshold, t_morphology), ('blobs', t_morphology, t_blobs)):
+        stage_times.setdefault(stage, []).append((end - begin) * 1000.0)
+
+
+def run_detector(mode, scenario, frames, seed, kalman=False):
+    noise, gain, distractors = SCENARIOS[scenario]
+    scene = SyntheticScene(seed, noise, gain, distractors)
+    tracker = LaserTracker(detector_mode=mode, headless=True, kalman=kalman)
+    # nothing is dictated, so the Kalman filters may skip frames
+    tracker.heads[0].next_command_time = float('inf')
+    times = []
+    laser_errors = []
+    target_errors = []
+    laser_misses = 0
+    target_misses = 0
+    for i in range(frames):
+        frame, laser, led = scene.frame(i, frames)
+        if mode == 'yuv':
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420).ravel()
+        start = time.time()
+        tracker.detect(frame)
+        times.append((time.time() - start) * 1000.0)
+        located = tracker.last_located
+        for found, truth, errors in ((located[0], laser, laser_errors), (located[2], led, target_errors)):
+            error = error_px(found, truth)
+            if error is None:
+                if errors is laser_errors:
+                    laser_misses += 1
+                else:
+                    target_misses += 1
+            else:
+                errors.append(error)
+    total = sum(times)
+    return {
+        'fps': frames * 1000.0 / total if total > 0 else None,
+        'frame_ms': summarize(times),
+        'laser_error_px': summarize(laser_errors),
+        'target_error_px': summarize(target_errors),
+        'laser_miss_rate': float(laser_misses) / frames,
+        'target_miss_rate': float(target_misses) / frames
+    }
+
+
+def run_benchmark(detectors, scenarios, frames, seed, kalman=False):
+    report = {
+        'settings': {
+            'frames': frames,
+            'seed': seed,
+            'kalman': kalman,
+            'resolution': list(RESOLUTION)
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__
+        },
+        'stages_ms': {},
+        'results': {}
+    }
+    for scenario in scenarios:
+        scene = SyntheticScene(seed, *SCENARIOS[scenario])
+        stage_times = {}
+        for i in range(min(frames, 20)):
+            time_stages(scene.frame(i, frames)[0], stage_times)
+        report['stages_ms'][scenario] = dict((stage, summarize(t)) for stage, t in stage_times.items())
+        for mode in detectors:
+            result = run_detector(mode, scenario, frames, seed, kalman)
+            report['results'].setdefault(mode, {})[scenario] = result
+            print("%-8s %-12s %7.1f fps  laser err %s" % (
+                mode, scenario, result['fps'],
+                'n/a' if result['laser_error_px'] is None else '%.1f px' % result['laser_error_px']['mean']))
+    return report
+
+
+'''
+Print each detector/scenario fps relative to a previous report
+'''
+def compare(report, previous):
+    if previous.get('settings') != report.get('settings'):
+        print("Warning: settings differ from the previous report, results may not be comparable")
+    for mode, scenarios in sorted(report['results'].items()):
+        for scenario, result in sorted(scenarios.items()):
+            before = previous.get('results', {}).get(mode, {}).get(scenario)
+            if before is None or not before.get('fps') or not result['fps']:
+                continue
+            print("%-8s %-12s %7.1f -> %7.1f fps (x%.2f)" % (
+                mode, scenario, before['fps'], result['fps'], result['fps'] / before['fps']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the laser/LED detector on synthetic frames.')
+    parser.add_argument('--detectors', nargs='+', default=DETECTORS, choices=DETECTORS,
+                        help='Detector modes to benchmark.')
+    parser.add_argument('--scenarios', nargs='+', default=sorted(SCENARIOS), choices=sorted(SCENARIOS),
+                        help='Synthetic scenes to generate.')
+    parser.add_argument('--frames', type=int, default=60,
+                        help='Frames per detector and scenario.')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='Random seed for the synthetic scenes.')
+    parser.add_argument('--kalman', action='store_true',
+                        help='Track through the Kalman filters, skipping frames where allowed.')
+    parser.add_argument('--output', help='Write the JSON report to this file.')
+    parser.add_argument('--compare', help='Previous JSON report to compare fps against.')
+    args = parser.parse_args()
+
+    report = run_benchmark(args.detectors, args.scenarios, args.frames, args.seed, args.kalman)
+    if args.output:
+        with open(args.output, 'w') as out_file:
+            json.dump(report, out_file, indent=2, sort_keys=True)
+        print("Wrote report to " + args.output)
+    if args.compare:
+        with open(args.compare, 'r') as in_file:
+            compare(report, json.load(in_file))
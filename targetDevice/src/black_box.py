@@ -0,0 +1,148 @@
+'''
+Always-on recorder of the last few seconds of downscaled frames and
+detection results, kept in a preallocated circular buffer. Events such as a
+target hit, a lost lock or a Lex retry flush the buffer to a compressed .npz
+file on a background thread. The file uses the same layout as FrameRecorder,
+so it can be replayed with ReplaySource, with the detections alongside:
+
+    timestamps      (n,) capture times
+    frame_000000... downscaled BGR frames, or the grey Y plane for YUV capture
+    located         (n, 6) laser x, y, radius, target x, y, radius (NaN when not found)
+    difference      (n, 2) the difference the command logic acted on (NaN when none)
+    event           name of the event that triggered the flush
+'''
+import os
+import time
+import threading
+try:
+    from queue import Queue, Full
+except ImportError:
+    from Queue import Queue, Full
+import cv2
+import numpy as np
+
+
+class BlackBoxRecorder(object):
+
+    def __init__(self, output_dir, seconds=10.0, framerate=15, resolution=(1280, 960), scale=0.25,
+                 grey=False, cooldown=5.0):
+        self.output_dir = output_dir
+        self.resolution = resolution
+        self.size = (int(resolution[0] * scale), int(resolution[1] * scale))
+        self.capacity = int(seconds * framerate)
+        shape = (self.capacity, self.size[1], self.size[0]) if grey else (self.capacity, self.size[1], self.size[0], 3)
+        self.frames = np.zeros(shape, dtype=np.uint8)
+        self.times = np.zeros(self.capacity)
+        self.located = np.full((self.capacity, 6), np.nan)
+        self.difference = np.full((self.capacity, 2), np.nan)
+        # sequence number held by each slot, -1 while it is being written
+        self.seqs = np.full(self.capacity, -1, dtype=np.int64)
+        self.seq = 0
+        # the flush copies out of the live ring into this, oldest slot first
+        self.snapshot_frames = np.zeros_like(self.frames)
+        self.snapshot_times = np.zeros_like(self.times)
+        self.snapshot_located = np.zeros_like(self.located)
+        self.snapshot_difference = np.zeros_like(self.difference)
+        # at most one flush per cooldown seconds, whatever the event
+        self.cooldown = cooldown
+        self.next_flush = 0
+        self.events = Queue(4)
+        self.thread = None
+        self.flushed = 0
+        self.torn = 0
+        self.dropped_events = 0
+
+    def start(self):
+        if not os.path.isdir(self.output_dir):
+            os.makedirs(self.output_dir)
+        self.thread = threading.Thread(target=self._flush_loop)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.events.put(None)
+        self.thread.join()
+
+    '''
+    Downscale a frame into the next slot along with its detection results
+    '''
+    def record(self, frame, located, difference, t):
+        slot = self.seq % self.capacity
+        self.seqs[slot] = -1
+        if frame.ndim == 1:
+            # flat YUV420, keep the Y plane
+            frame = frame[:self.resolution[0] * self.resolution[1]].reshape(self.resolution[1], self.resolution[0])
+        cv2.resize(frame, self.size, dst=self.frames[slot], interpolation=cv2.INTER_AREA)
+        self.times[slot] = t
+        row = self.located[slot]
+        row.fill(np.nan)
+        if located is not None:
+            red_center, red_radius, green_center, green_radius = located
+            if red_center is not None:
+                row[0], row[1], row[2] = red_center[0], red_center[1], red_radius
+            if green_center is not None:
+                row[3], row[4], row[5] = green_center[0], green_center[1], green_radius
+        if difference is not None:
+            self.difference[slot, 0] = difference[0]
+            self.difference[slot, 1] = difference[1]
+        else:
+            self.difference[slot].fill(np.nan)
+        self.seqs[slot] = self.seq
+        self.seq += 1
+
+    '''
+    Ask for the buffer up to now to be written out. Safe to call from any
+    thread, and never waits for the write.
+    '''
+    def trigger(self, event):
+        now = time.time()
+        if now < self.next_flush or self.seq == 0:
+            return
+        self.next_flush = now + self.cooldown
+        try:
+            self.events.put_nowait((event, now, self.seq))
+        except Full:
+            self.dropped_events += 1
+
+    def _flush_loop(self):
+        while True:
+            item = self.events.get()
+            if item is None:
+                break
+            event, event_time, end = item
+            self._flush(event, event_time, end)
+
+    def _flush(self, event, event_time, end):
+        count = 0
+        for seq in range(max(0, end - self.capacity), end):
+            slot = seq % self.capacity
+            if self.seqs[slot] != seq:
+                # already overwritten by the capture path
+                self.torn += 1
+                continue
+            self.snapshot_frames[count] = self.frames[slot]
+            self.snapshot_times[count] = self.times[slot]
+            self.snapshot_located[count] = self.located[slot]
+            self.snapshot_difference[count] = self.difference[slot]
+            if self.seqs[slot] != seq:
+                self.torn += 1
+                continue
+            count += 1
+        if count == 0:
+            return
+        arrays = dict(('frame_%06d' % i, self.snapshot_frames[i]) for i in range(count))
+        path = os.path.join(self.output_dir, 'blackbox_' + time.strftime('%Y%m%d-%H%M%S', time.localtime(event_time)) +
+                            '_' + event + '.npz')
+        np.savez_compressed(path, timestamps=self.snapshot_times[:count], located=self.snapshot_located[:count],
+                            difference=self.snapshot_difference[:count], event=np.array(event), **arrays)
+        self.flushed += 1
+        print("Black box: wrote " + str(count) + " frames to " + path + " after " + event)
+
+    def stats(self):
+        return {
+            'recorded': self.seq,
+            'flushed': self.flushed,
+            'torn': self.torn,
+            'dropped_events': self.dropped_events
+        }
@@ -0,0 +1,132 @@
+'''
+Fixed-size history of recent laser and target centroids, with median and
+exponential moving average estimates of where each one is. The decision
+logic acts on these rather than on a single frame, so one noisy frame can
+neither trigger nor suppress a command.
+
+All buffers are allocated up front; pushing a centroid and computing an
+estimate write into them in place.
+'''
+import math
+import numpy as np
+
+
+'''
+Ring buffer of one centroid's positions and timestamps. Only frames where the
+centroid was found are pushed, so every stored entry is valid.
+'''
+class CentroidRing(object):
+
+    def __init__(self, capacity=15, ema_tau=0.2):
+        self.capacity = capacity
+        self.points = np.zeros((capacity, 2))
+        self.times = np.zeros(capacity)
+        # scratch space the median partitions in place
+        self.scratch = np.zeros((capacity, 2))
+        self.median_out = np.zeros(2)
+        self.lower_out = np.zeros(2)
+        self.ema_out = np.zeros(2)
+        # time constant of the moving average, in seconds
+        self.ema_tau = ema_tau
+        self.head = 0
+        self.count = 0
+        self.last_time = None
+
+    def reset(self):
+        self.head = 0
+        self.count = 0
+        self.last_time = None
+
+    def push(self, t, point):
+        self.points[self.head, 0] = point[0]
+        self.points[self.head, 1] = point[1]
+        self.times[self.head] = t
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        if self.last_time is None:
+            self.ema_out[0] = point[0]
+            self.ema_out[1] = point[1]
+        else:
+            # weight the new point by how long the average has been standing
+            alpha = 1.0 - math.exp(-max(t - self.last_time, 0.0) / self.ema_tau)
+            self.ema_out[0] += alpha * (point[0] - self.ema_out[0])
+            self.ema_out[1] += alpha * (point[1] - self.ema_out[1])
+        self.last_time = t
+
+    '''
+    Number of the newest entries, up to `window`, younger than `max_age`
+    seconds at time `now`
+    '''
+    def fresh(self, now, max_age, window=None):
+        n = min(self.count, window) if window else self.count
+        i = 0
+        while i < n and now - self.times[(self.head - 1 - i) % self.capacity] <= max_age:
+            i += 1
+        return i
+
+    def median(self, n):
+        # the newest n entries are at most two contiguous runs of the ring,
+        # and their order does not matter for the median
+        first = min(n, self.head)
+        self.scratch[:first] = self.points[self.head - first:self.head]
+        if n > first:
+            self.scratch[first:n] = self.points[self.capacity - (n - first):]
+        values = self.scratch[:n]
+        mid = n // 2
+        values.partition(mid, axis=0)
+        self.median_out[:] = values[mid]
+        if n % 2 == 0:
+            # the lower middle is the largest of the lower half
+            np.max(values[:mid], axis=0, out=self.lower_out)
+            self.median_out += self.lower_out
+            self.median_out /= 2.0
+        return self.median_out
+
+
+class CentroidHistory(object):
+
+    def __init__(self, capacity=15, window=5, max_age=0.5, ema_tau=0.2):
+        self.laser = CentroidRing(capacity, ema_tau)
+        self.target = CentroidRing(capacity, ema_tau)
+        # frames the median is taken over
+        self.window = window
+        # entries older than this many seconds no longer count
+        self.max_age = max_age
+        self.now = None
+
+    def push(self, t, laser_center, target_center):
+        self.now = t
+        if laser_center is not None:
+            self.laser.push(t, laser_center)
+        if target_center is not None:
+            self.target.push(t, target_center)
+
+    '''
+    The target changed, so its old positions no longer apply
+    '''
+    def forget_target(self):
+        self.target.reset()
+
+    def estimate(self, ring, smoothing):
+        n = ring.fresh(self.now, self.max_age, self.window)
+        if n == 0:
+            return None
+        if smoothing == 'ema':
+            return ring.ema_out
+        return ring.median(n)
+
+    '''
+    Smoothed laser minus target position, as a tuple of whole pixels, or None
+    when either has not been seen within max_age. `smoothing` is 'median' or
+    'ema'.
+    '''
+    def difference(self, smoothing='median'):
+        if self.now is None:
+            return None
+        laser = self.estimate(self.laser, smoothing)
+        if laser is None:
+            return None
+        target = self.estimate(self.target, smoothing)
+        if target is None:
+            return None
+        return (int(round(laser[0] - target[0])), int(round(laser[1] - target[1])))
@@ -0,0 +1,155 @@
+'''
+Precomputed colour lookup table that classifies every BGR pixel as laser,
+target or background with a single table lookup per pixel, instead of
+converting to HSV and running a separate inRange for each colour.
+
+The lookup is done by cv2.remap. Each pixel is widened to BGRA and quantized
+in place so that its bytes, read as two int16s, are the (x, y) of its bin in
+the table. That takes three cheap whole-frame passes to build the index and
+one gather to classify.
+'''
+import os
+import json
+import hashlib
+import cv2
+import numpy as np
+import stage_timing
+from laser_detection import largest_blob, default_thresholds, BLUR_KERNEL
+
+BACKGROUND = 0
+LASER = 1
+TARGET = 2
+
+# bits kept per channel, so the table has (2 ** bits) ** 3 entries
+DEFAULT_BITS = 5
+
+
+'''
+Build the table by classifying the centre of every quantized BGR bin with the
+HSV ranges. It is laid out as an image for cv2.remap, the bin of quantized
+(b, g, r) at row r and column b + 256 * g.
+'''
+def build_lut(thresholds, bits=DEFAULT_BITS):
+    levels = 1 << bits
+    step = 256 >> bits
+    centers = (np.arange(levels) * step + step // 2).astype(np.uint8)
+    b, g, r = np.meshgrid(centers, centers, centers, indexing='ij')
+    bgr = np.stack([b, g, r], axis=-1).reshape(-1, 1, 3)
+    hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+
+    labels = np.zeros(levels ** 3, dtype=np.uint8)
+    green = thresholds['green']
+    red = thresholds['red']
+    labels[cv2.inRange(hsv, np.array(green['lower']), np.array(green['upper'])).ravel() > 0] = TARGET
+    labels[cv2.inRange(hsv, np.array(red['lower']), np.array(red['upper'])).ravel() > 0] = LASER
+    labels = labels.reshape(levels, levels, levels)
+
+    # remap needs fewer than SHRT_MAX columns, hence at most 7 bits
+    lut = np.zeros((levels, (levels - 1) * 256 + levels), dtype=np.uint8)
+    for green_level in range(levels):
+        lut[:, green_level * 256:green_level * 256 + levels] = labels[:, green_level, :].T
+    return lut
+
+
+class ColorLut(object):
+
+    def __init__(self, thresholds=None, cache_dir='.', bits=DEFAULT_BITS):
+        self.thresholds = thresholds if thresholds is not None else default_thresholds()
+        self.cache_dir = cache_dir
+        self.bits = bits
+        self.lut = None
+        # scratch buffers, reallocated only if the frame size changes
+        self.shape = None
+
+    def cache_path(self):
+        key = json.dumps({'thresholds': self.thresholds, 'bits': self.bits, 'layout': 'remap'}, sort_keys=True)
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self.cache_dir, 'color_lut_' + digest + '.npy')
+
+    '''
+    Load the table for the current thresholds from the cache directory, or
+    build it and cache it there.
+    '''
+    def load(self):
+        path = self.cache_path()
+        if os.path.isfile(path):
+            self.lut = np.load(path)
+            print("Loaded colour lookup table from " + path)
+        else:
+            self.lut = build_lut(self.thresholds, self.bits)
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            np.save(path, self.lut)
+            print("Built colour lookup table and cached it in " + path)
+        return self
+
+    def _allocate(self, shape):
+        height, width = shape[:2]
+        self.shape = shape
+        self.bgra = np.empty((height, width, 4), dtype=np.uint8)
+        # the same pixels as one little-endian word each, as on the Pi, and
+        # as the (x, y) int16 pairs remap reads
+        self.words = self.bgra.view(np.uint32).reshape(height, width)
+        self.coords = self.bgra.view(np.int16).reshape(height, width, 2)
+        self.labels = np.empty((height, width), dtype=np.uint8)
+        top = (1 << self.bits) - 1
+        self.keep = np.uint32(top | top << 8 | top << 16)
+
+    '''
+    Return a label image with BACKGROUND, LASER or TARGET for every pixel. The
+    returned array is reused by the next call.
+    '''
+    def classify(self, frame):
+        if self.shape != frame.shape:
+            self._allocate(frame.shape)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA, dst=self.bgra)
+        # quantize every byte of the word at once and clear alpha, leaving
+        # x = b + 256 * g and y = r
+        np.right_shift(self.words, 8 - self.bits, out=self.words)
+        np.bitwise_and(self.words, self.keep, out=self.words)
+        cv2.remap(self.lut, self.coords, None, cv2.INTER_NEAREST, dst=self.labels)
+        return self.labels
+
+
+'''
+Detector that blurs, classifies both colours with a ColorLut and then pulls
+each blob out of the label image.
+'''
+class LutDetector(object):
+
+    def __init__(self, color_lut):
+        self.color_lut = color_lut
+        self.blurred = None
+        self.masks = {}
+        self.morph_tmp = None
+
+    def _mask(self, labels, label):
+        mask = self.masks.get(label)
+        if mask is None or mask.shape != labels.shape:
+            mask = self.masks[label] = np.empty_like(labels)
+            self.morph_tmp = np.empty_like(labels)
+        t = stage_timing.timer.mark()
+        cv2.compare(labels, label, cv2.CMP_EQ, dst=mask)
+        t = stage_timing.timer.record('threshold', t)
+        cv2.erode(mask, None, dst=self.morph_tmp, iterations=2)
+        cv2.dilate(self.morph_tmp, None, dst=mask, iterations=2)
+        stage_timing.timer.record('morphology', t)
+        return mask
+
+    def locate(self, frame, find_target=True):
+        if self.blurred is None or self.blurred.shape != frame.shape:
+            self.blurred = np.empty_like(frame)
+        t = stage_timing.timer.mark()
+        cv2.GaussianBlur(frame, BLUR_KERNEL, 0, dst=self.blurred)
+        t = stage_timing.timer.record('blur', t)
+        # the table lookup replaces both the conversion and the thresholds
+        labels = self.color_lut.classify(self.blurred)
+        stage_timing.timer.record('threshold', t)
+        red_center, red_radius = largest_blob(self._mask(labels, LASER))
+        green_center, green_radius = None, 0
+        if find_target:
+            green_center, green_radius = largest_blob(self._mask(labels, TARGET))
+        return red_center, red_radius, green_center, green_radius
+
+    def forget_target(self):
+        pass
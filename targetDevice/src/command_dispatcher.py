@@ -0,0 +1,95 @@
+'''
+Long-lived dispatcher that speaks and sends commands on its own thread, so
+the camera loop only hands a command off and goes back to the next frame.
+
+At most one command waits per key (a head). A newer command for the same key
+replaces the waiting one, and a command that waited longer than max_age
+seconds is dropped rather than dictated late. The on_expired callback is
+told about those, so the caller can undo what it assumed when it submitted.
+'''
+import time
+import threading
+import traceback
+from collections import OrderedDict
+
+
+class CommandDispatcher(object):
+
+    def __init__(self, run_command, max_age=3.0, on_expired=None):
+        # called on the dispatcher thread with the arguments given to submit()
+        self.run_command = run_command
+        self.on_expired = on_expired
+        self.max_age = max_age
+        # key -> (submit time, arguments), oldest first
+        self.pending = OrderedDict()
+        self.cond = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.submitted = 0
+        self.completed = 0
+        self.superseded = 0
+        self.expired = 0
+        self.failed = 0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._loop)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.thread.join(timeout)
+
+    '''
+    Queue a command for a key without waiting for it, replacing any command
+    still waiting for the same key
+    '''
+    def submit(self, key, *args):
+        with self.cond:
+            if key in self.pending:
+                del self.pending[key]
+                self.superseded += 1
+            self.pending[key] = (time.time(), args)
+            self.submitted += 1
+            self.cond.notify()
+
+    '''
+    Whether a command for the key is waiting to be dispatched
+    '''
+    def waiting(self, key):
+        with self.cond:
+            return key in self.pending
+
+    def _loop(self):
+        while True:
+            with self.cond:
+                while self.running and not self.pending:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                key, (submitted, args) = self.pending.popitem(last=False)
+            if time.time() - submitted > self.max_age:
+                self.expired += 1
+                if self.on_expired is not None:
+                    self.on_expired(*args)
+                continue
+            try:
+                self.run_command(*args)
+                self.completed += 1
+            except Exception:
+                # keep dispatching later commands
+                self.failed += 1
+                print("Command failed: " + traceback.format_exc())
+
+    def stats(self):
+        return {
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'superseded': self.superseded,
+            'expired': self.expired,
+            'failed': self.failed
+        }
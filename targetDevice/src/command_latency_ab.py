@@ -0,0 +1,102 @@
+#! /usr/bin/env python
+'''
+A/B test of the command paths. Sends the same commands to one head over each
+path in turn (spoken to Lex, as text to Lex, straight to the IoT shadow) and
+measures how long each takes to be delivered and until the head reports it
+has moved. The head's laser_guidance_thing.py has to be running, since the
+move is seen through the trace ID it echoes in its reported state. No camera
+is needed.
+
+The paths are interleaved round by round so drift in network or service
+latency hits them all alike, and the commands alternate left and right so
+the head ends up where it started.
+
+    python command_latency_ab.py --count 20 --thing lg_thing_0
+'''
+import argparse
+import json
+import time
+from latency_trace import new_trace_id
+from latency_report import summarize
+from multi_laser import Head
+from direct_intent import ShadowMover
+from track_laser import LaserTracker, SAMPLE_RATE, COMMANDS
+
+PATHS = ['audio', 'text', 'shadow']
+
+
+'''
+Seconds until the thing's reported state carries the trace ID, or None when
+it doesn't within timeout seconds
+'''
+def wait_for_move(mover, thing, trace_id, start, timeout=10.0, poll_interval=0.05):
+    while time.time() - start < timeout:
+        reported = mover.shadow(thing)['state'].get('reported', {})
+        if reported.get('trace_id') == trace_id:
+            return time.time() - start
+        time.sleep(poll_interval)
+    return None
+
+
+def run_ab(paths, count, thing, timeout=10.0, trace_log=None):
+    tracker = LaserTracker(headless=True, trace_log=trace_log)
+    head = Head('ab', thing)
+    polly = tracker.connectToPolly()
+    lex = tracker.connectToLex()
+    tracker.mover = ShadowMover(tracker.step_amount, tracker.connectToIot())
+    # the audio path shouldn't pay for Polly the first time
+    tracker.speech_cache.prewarm(polly, [(command, 'Joanna', 'pcm', SAMPLE_RATE) for command in COMMANDS])
+    results = dict((path, {'sent_ms': [], 'moved_ms': [], 'lost': 0}) for path in paths)
+    for i in range(count):
+        command = 'move left' if i % 2 == 0 else 'move right'
+        for path in paths:
+            trace_id = new_trace_id()
+            start = time.time()
+            tracker.trace(trace_id, 'frame', t=start, command=command, path=path)
+            tracker.deliver(polly, lex, command, head, trace_id, path)
+            results[path]['sent_ms'].append((time.time() - start) * 1000)
+            moved = wait_for_move(tracker.mover, thing, trace_id, start, timeout)
+            if moved is None:
+                print(path + " command " + trace_id + " was not seen to move the head")
+                results[path]['lost'] += 1
+            else:
+                tracker.trace(trace_id, 'motion_observed')
+                results[path]['moved_ms'].append(moved * 1000)
+    if tracker.tracer is not None:
+        tracker.tracer.close()
+    return dict((path, {
+        'sent': summarize(r['sent_ms']),
+        'moved': summarize(r['moved_ms']) if r['moved_ms'] else None,
+        'lost': r['lost']
+    }) for path, r in results.items())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare command latency over the audio, text and shadow paths.')
+    parser.add_argument('--paths', nargs='+', default=PATHS, choices=PATHS,
+                        help='Command paths to compare.')
+    parser.add_argument('--count', type=int, default=10,
+                        help='Commands sent over each path.')
+    parser.add_argument('--thing', default='lg_thing_0',
+                        help='IoT thing of the head to move.')
+    parser.add_argument('--timeout', type=float, default=10.0,
+                        help='Seconds to wait for the head to report a move.')
+    parser.add_argument('--trace-log', dest='trace_log',
+                        help='Also log hop timestamps here, for latency_report.py.')
+    parser.add_argument('--json', dest='json_output', action='store_true',
+                        help='Print the results as JSON instead of a table.')
+    args = parser.parse_args()
+
+    results = run_ab(args.paths, args.count, args.thing, args.timeout, args.trace_log)
+    if args.json_output:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        print("%-8s %-6s %6s %9s %9s %9s %6s" % ('path', 'until', 'count', 'mean ms', 'p50 ms', 'p95 ms', 'lost'))
+        for path in args.paths:
+            for until in ('sent', 'moved'):
+                s = results[path][until]
+                if s is None:
+                    print("%-8s %-6s %6d %9s %9s %9s %6d" % (path, until, 0, '-', '-', '-', results[path]['lost']))
+                else:
+                    print("%-8s %-6s %6d %9.1f %9.1f %9.1f %6d" % (path, until, s['count'], s['mean_ms'], s['p50_ms'],
+                                                                 s['p95_ms'], results[path]['lost']))
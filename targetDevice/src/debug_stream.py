@@ -0,0 +1,141 @@
+'''
+Serves annotated frames as an MJPEG stream over HTTP from its own threads, at
+a capped rate, so a headless unit can still be watched from a browser without
+slowing down the tracking loop.
+'''
+import threading
+import time
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+import cv2
+import numpy as np
+
+BOUNDARY = 'frame'
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class DebugStream(object):
+
+    '''
+    `draw(frame, located)` annotates a BGR frame in place and `to_bgr(frame)`
+    converts captured frames to BGR when they are in another format.
+    '''
+    def __init__(self, port=8080, max_fps=2.0, draw=None, to_bgr=None, scale=0.5, quality=70):
+        self.port = port
+        self.interval = 1.0 / max_fps
+        self.draw = draw
+        self.to_bgr = to_bgr
+        self.scale = scale
+        self.quality = quality
+        self.condition = threading.Condition()
+        self.server = None
+        self.clients = 0
+        self.next_frame_time = 0
+        # latest offered frame and the JPEG made from it
+        self.buffer = None
+        self.located = None
+        self.seq = 0
+        self.jpeg = None
+        self.jpeg_seq = 0
+
+    def start(self):
+        stream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stream.serve_client(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('', self.port), Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        print("Serving debug stream on port " + str(self.port))
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        with self.condition:
+            self.condition.notify_all()
+
+    '''
+    Called from the tracking loop for every frame. Only copies the frame when
+    somebody is watching and the rate cap allows it; encoding happens on the
+    client threads.
+    '''
+    def offer(self, frame, located):
+        if self.clients == 0:
+            return
+        now = time.time()
+        if now < self.next_frame_time:
+            return
+        self.next_frame_time = now + self.interval
+        with self.condition:
+            if self.buffer is None or self.buffer.shape != frame.shape:
+                self.buffer = np.empty_like(frame)
+            np.copyto(self.buffer, frame)
+            self.located = located
+            self.seq += 1
+            self.condition.notify_all()
+
+    def _encode(self):
+        frame = self.buffer
+        if self.to_bgr is not None:
+            frame = self.to_bgr(frame)
+        if self.draw is not None:
+            self.draw(frame, self.located)
+        if self.scale != 1.0:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.quality])
+        if ok:
+            self.jpeg = encoded.tobytes()
+            self.jpeg_seq = self.seq
+
+    '''
+    Block until a frame newer than `last_seq` has been offered and return
+    (seq, jpeg bytes). Each frame is only encoded once however many clients
+    are watching.
+    '''
+    def wait_for_jpeg(self, last_seq, timeout=5.0):
+        with self.condition:
+            if self.seq == last_seq:
+                self.condition.wait(timeout)
+            if self.seq == last_seq:
+                return last_seq, None
+            if self.jpeg_seq != self.seq:
+                self._encode()
+            return self.jpeg_seq, self.jpeg
+
+    def serve_client(self, handler):
+        handler.send_response(200)
+        handler.send_header('Cache-Control', 'no-cache')
+        handler.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=' + BOUNDARY)
+        handler.end_headers()
+        self.clients += 1
+        last_seq = self.seq
+        try:
+            while self.server is not None:
+                last_seq, jpeg = self.wait_for_jpeg(last_seq)
+                if jpeg is None:
+                    continue
+                handler.wfile.write(('--' + BOUNDARY + '\r\n').encode())
+                handler.wfile.write(b'Content-Type: image/jpeg\r\n')
+                handler.wfile.write(('Content-Length: ' + str(len(jpeg)) + '\r\n\r\n').encode())
+                handler.wfile.write(jpeg)
+                handler.wfile.write(b'\r\n')
+        except (IOError, OSError):
+            # the viewer went away
+            pass
+        finally:
+            self.clients -= 1
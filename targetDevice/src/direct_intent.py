@@ -0,0 +1,73 @@
+'''
+Moves a pan/tilt head without the Polly and Lex audio round trip, by writing
+the desired position to the head's IoT thing shadow the way the fulfilment
+Lambda (alexa_lambda.py) does once Lex has recognised a command.
+'''
+import json
+import boto3
+from botocore.exceptions import ClientError
+
+DIRECTIONS = ('up', 'down', 'left', 'right')
+
+
+'''
+Direction and amount of a dictated command, e.g. "move left 5" gives
+('left', 5). The amount is None when the command has none, and direction is
+None when it isn't a move.
+'''
+def parse_command(command):
+    words = command.split()
+    if len(words) < 2 or words[0] != 'move' or words[1] not in DIRECTIONS:
+        return None, None
+    amount = int(words[2]) if len(words) > 2 else None
+    return words[1], amount
+
+
+class ShadowMover(object):
+
+    def __init__(self, step=10, client=None):
+        # how far a command without an amount moves, as the Lambda's
+        # default_step_amount
+        self.step = step
+        self.client = client if client is not None else boto3.client('iot-data')
+
+    def shadow(self, thing):
+        try:
+            response = self.client.get_thing_shadow(thingName=thing)
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ResourceNotFoundException':
+                return {'state': {}}
+            raise
+        return json.loads(response['payload'].read())
+
+    '''
+    Where the head was last asked to go, or where it is when it was never
+    asked
+    '''
+    def position(self, thing):
+        state = self.shadow(thing)['state']
+        x = 0
+        y = 0
+        for section in ('reported', 'desired'):
+            x = state.get(section, {}).get('x', x)
+            y = state.get(section, {}).get('y', y)
+        return x, y
+
+    def move(self, thing, direction, amount=None, trace_id=None):
+        delta = amount if amount is not None else self.step
+        x, y = self.position(thing)
+        # same directions as the Lambda's MovementClient
+        if direction == 'up':
+            y -= delta
+        elif direction == 'down':
+            y += delta
+        elif direction == 'left':
+            x += delta
+        elif direction == 'right':
+            x -= delta
+        else:
+            x, y = 0, 0
+        desired = {'x': x, 'y': y}
+        if trace_id is not None:
+            desired['trace_id'] = trace_id
+        self.client.update_thing_shadow(thingName=thing, payload=json.dumps({'state': {'desired': desired}}))
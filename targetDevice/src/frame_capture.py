@@ -0,0 +1,106 @@
+'''
+Captures camera frames on a background thread into a fixed pool of
+preallocated numpy buffers, so the processing loop always works on the
+newest frame instead of a backlog of stale ones.
+'''
+import threading
+import numpy as np
+
+
+class ThreadedCapture(object):
+
+    '''
+    `capture_sequence` is called on the capture thread with an iterator of
+    buffers and must fill them in order, e.g.
+    lambda outputs: camera.capture_sequence(outputs, format='bgr', use_video_port=True)
+    '''
+    def __init__(self, capture_sequence, shape, pool_size=3):
+        # one buffer being filled, one published and one held by the reader
+        assert pool_size >= 3
+        self.capture_sequence = capture_sequence
+        self.buffers = [np.empty(shape, dtype=np.uint8) for _ in range(pool_size)]
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.error = None
+        # index of the newest complete frame and of the frame the reader holds
+        self.latest = None
+        self.reading = None
+        self.latest_seq = 0
+        self.read_seq = 0
+        self.captured = 0
+        self.processed = 0
+        self.dropped = 0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._capture_loop)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(2)
+
+    def _capture_loop(self):
+        try:
+            self.capture_sequence(self._outputs())
+        except Exception as e:
+            print("Capture thread stopped: " + str(e))
+            self.error = e
+        finally:
+            with self.condition:
+                self.running = False
+                self.condition.notify_all()
+
+    def _outputs(self):
+        filled = None
+        index = 0
+        while self.running:
+            with self.condition:
+                if filled is not None:
+                    self._publish(filled)
+                # next buffer that is neither published nor being processed
+                index = (index + 1) % len(self.buffers)
+                while index == self.latest or index == self.reading:
+                    index = (index + 1) % len(self.buffers)
+            filled = index
+            yield self.buffers[index]
+
+    def _publish(self, index):
+        if self.latest_seq > self.read_seq:
+            # the previous frame was never picked up by the reader
+            self.dropped += 1
+        self.latest = index
+        self.latest_seq += 1
+        self.captured += 1
+        self.condition.notify_all()
+
+    '''
+    Block until a frame newer than the last one read is available and return
+    it. The buffer stays owned by the caller until the next call to read().
+    Returns None once capture has stopped.
+    '''
+    def read(self, timeout=None):
+        with self.condition:
+            while self.running and self.latest_seq == self.read_seq:
+                self.condition.wait(timeout)
+                if timeout is not None:
+                    break
+            if self.latest_seq == self.read_seq:
+                return None
+            self.reading = self.latest
+            self.read_seq = self.latest_seq
+            self.processed += 1
+            return self.buffers[self.reading]
+
+    def stats(self):
+        return {
+            'captured': self.captured,
+            'processed': self.processed,
+            'dropped': self.dropped
+        }
@@ -0,0 +1,257 @@
+'''
+Pluggable sources of camera frames, so the detector can be driven by the Pi
+camera, any V4L2 device OpenCV can open, or a recorded session replayed on a
+machine without a camera. Every source is a context manager with the same
+methods:
+
+    frame_shape()               shape of the numpy frames it produces
+    frames()                    generator of frames, captured on this thread
+    capture_sequence(outputs)   fill each buffer of an iterator in turn, for ThreadedCapture
+    grab()                      a single new frame
+    set_framerate(fps)          change the frame rate while capturing, where the source can
+'''
+import io
+import time
+import zipfile
+import threading
+try:
+    from queue import Queue, Full
+except ImportError:
+    from Queue import Queue, Full
+import cv2
+import numpy as np
+try:
+    from picamera.array import PiRGBArray
+    from picamera import PiCamera
+except ImportError:
+    # not on a Pi, only the other sources are available
+    PiCamera = None
+
+
+class PiCameraSource(object):
+
+    def __init__(self, resolution=(1280, 960), framerate=15, capture_format='bgr'):
+        self.resolution = resolution
+        self.framerate = framerate
+        # 'bgr', or 'yuv' for flat YUV420 buffers
+        self.capture_format = capture_format
+        self.camera = None
+
+    def __enter__(self):
+        # with-block ensures camera.close() is called upon exit.
+        self.camera = PiCamera(resolution=self.resolution, framerate=self.framerate)
+        # allow the camera to warmup
+        time.sleep(0.1)
+        return self
+
+    def __exit__(self, *exc):
+        self.camera.close()
+
+    def frame_shape(self):
+        if self.capture_format == 'yuv':
+            # flat Y plane followed by the quarter size U and V planes
+            return (self.resolution[0] * self.resolution[1] * 3 // 2,)
+        return (self.resolution[1], self.resolution[0], 3)
+
+    def grab(self):
+        frame = np.empty((self.resolution[1], self.resolution[0], 3), dtype=np.uint8)
+        self.camera.capture(frame, format="bgr", use_video_port=True)
+        return frame
+
+    def set_framerate(self, fps):
+        # framerate itself can't change while the video port is in use, but
+        # the delta can
+        self.camera.framerate_delta = fps - self.framerate
+
+    def capture_sequence(self, outputs):
+        self.camera.capture_sequence(outputs, format=self.capture_format, use_video_port=True)
+
+    def frames(self):
+        if self.capture_format == 'yuv':
+            # the camera writes each frame straight into the same buffer
+            buf = np.empty(self.frame_shape(), dtype=np.uint8)
+            for frame in self.camera.capture_continuous(buf, format="yuv", use_video_port=True):
+                yield buf
+        else:
+            rawCapture = PiRGBArray(self.camera, size=self.resolution)
+            for frame in self.camera.capture_continuous(rawCapture, format="bgr", use_video_port=True):
+                # grab the raw NumPy array representing the image
+                yield frame.array
+                # clear the stream in preparation for the next frame
+                rawCapture.truncate(0)
+
+
+'''
+Any camera OpenCV can open through cv2.VideoCapture, e.g. a V4L2 webcam.
+Frames are resized to the requested resolution if the device ignores it.
+'''
+class VideoCaptureSource(object):
+
+    def __init__(self, device=0, resolution=(1280, 960)):
+        self.device = device
+        self.resolution = resolution
+        self.capture = None
+
+    def __enter__(self):
+        self.capture = cv2.VideoCapture(self.device)
+        if not self.capture.isOpened():
+            raise IOError("Could not open video device " + str(self.device))
+        self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.resolution[0])
+        self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.resolution[1])
+        return self
+
+    def __exit__(self, *exc):
+        self.capture.release()
+
+    def frame_shape(self):
+        return (self.resolution[1], self.resolution[0], 3)
+
+    def _read_into(self, buf):
+        ok, frame = self.capture.read()
+        if not ok:
+            return False
+        if frame.shape == buf.shape:
+            np.copyto(buf, frame)
+        else:
+            cv2.resize(frame, self.resolution, dst=buf)
+        return True
+
+    def grab(self):
+        frame = np.empty(self.frame_shape(), dtype=np.uint8)
+        if not self._read_into(frame):
+            raise IOError("Could not read from video device " + str(self.device))
+        return frame
+
+    def set_framerate(self, fps):
+        # not every driver honours this
+        self.capture.set(cv2.CAP_PROP_FPS, fps)
+
+    def capture_sequence(self, outputs):
+        for buf in outputs:
+            if not self._read_into(buf):
+                break
+
+    def frames(self):
+        buf = np.empty(self.frame_shape(), dtype=np.uint8)
+        while self._read_into(buf):
+            yield buf
+
+
+'''
+Replays a session saved by FrameRecorder, either as fast as the consumer
+takes frames or paced by the recorded timestamps.
+'''
+class ReplaySource(object):
+
+    def __init__(self, path, realtime=False):
+        self.path = path
+        self.realtime = realtime
+        self.archive = None
+        self.timestamps = None
+
+    def __enter__(self):
+        self.archive = np.load(self.path)
+        self.timestamps = self.archive['timestamps']
+        return self
+
+    def __exit__(self, *exc):
+        self.archive.close()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def frame(self, index):
+        return self.archive['frame_%06d' % index]
+
+    def frame_shape(self):
+        return self.frame(0).shape
+
+    def grab(self):
+        return self.frame(0)
+
+    def set_framerate(self, fps):
+        # recordings play back at their own pace
+        pass
+
+    def frames(self):
+        start = time.time()
+        for i in range(len(self.timestamps)):
+            if self.realtime:
+                delay = (self.timestamps[i] - self.timestamps[0]) - (time.time() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            yield self.frame(i)
+
+    def capture_sequence(self, outputs):
+        frames = self.frames()
+        for buf in outputs:
+            frame = next(frames, None)
+            if frame is None:
+                break
+            np.copyto(buf, frame)
+
+
+'''
+Saves frames with their capture timestamps into a compressed .npz archive
+that ReplaySource can play back. Frames are copied onto a queue and
+compressed on a background thread; when the writer falls behind, frames are
+dropped rather than stalling the caller.
+'''
+class FrameRecorder(object):
+
+    def __init__(self, path, max_queue=30):
+        self.path = path
+        self.queue = Queue(max_queue)
+        self.timestamps = []
+        self.thread = None
+        self.archive = None
+        self.recorded = 0
+        self.dropped = 0
+
+    def start(self):
+        self.archive = zipfile.ZipFile(self.path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+        self.thread = threading.Thread(target=self._write_loop)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def _write_array(self, name, array):
+        buf = io.BytesIO()
+        np.save(buf, array)
+        self.archive.writestr(name + '.npy', buf.getvalue())
+
+    def _write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            timestamp, frame = item
+            self._write_array('frame_%06d' % len(self.timestamps), frame)
+            self.timestamps.append(timestamp)
+
+    def record(self, frame, timestamp=None):
+        try:
+            self.queue.put_nowait((timestamp if timestamp is not None else time.time(), frame.copy()))
+            self.recorded += 1
+        except Full:
+            self.dropped += 1
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self._write_array('timestamps', np.array(self.timestamps, dtype=np.float64))
+        self.archive.close()
+        print("Recorded " + str(len(self.timestamps)) + " frames to " + self.path +
+              " (" + str(self.dropped) + " dropped)")
+
+
+'''
+Build a source by name: 'picamera', 'v4l2' or 'replay'
+'''
+def open_frame_source(name, resolution=(1280, 960), framerate=15, device=0, replay_path=None,
+                      capture_format='bgr', realtime=False):
+    if name == 'v4l2':
+        return VideoCaptureSource(device, resolution)
+    if name == 'replay':
+        return ReplaySource(replay_path, realtime)
+    return PiCameraSource(resolution, framerate, capture_format)
@@ -0,0 +1,309 @@
+#! /usr/bin/env python
+'''
+Picks tight HSV ranges for the laser and the target LEDs from what the camera
+actually sees, and stores them as named profiles, one per lighting
+condition. A profile is a JSON file in the range-detector --output format,
+so it can be given to track_laser.py with --profile NAME (or --thresholds
+PATH) and to every detector mode. The same samples are also fitted in YUV,
+as the yuv detector sees them, and stored in the profile's 'yuv' section.
+
+The LEDs are lit one at a time against a frame with all of them off, and the
+laser is swept across the view (by hand or by the pan/tilt head) while frames
+are captured. The pixels that change are the samples. The ranges start wide
+around the samples and are narrowed until the rest of the calibration frames
+produce almost no stray mask pixels, since small masks are what keep the
+morphology and blob passes fast.
+
+    python hsv_calibration.py office --sweep-seconds 8
+    python track_laser.py --profile office
+'''
+import os
+import json
+import time
+import argparse
+import cv2
+import numpy as np
+try:
+    import RPi.GPIO as gpio
+except ImportError:
+    # no GPIO off the Pi, only the laser can be calibrated
+    gpio = None
+from laser_detection import preprocess, color_mask, hsv_ranges, yuv_ranges, yuv_mask, YuvDetector
+from frame_sources import open_frame_source
+
+PROFILE_DIR = 'hsv_profiles'
+
+# percentiles of the samples tried as range bounds, widest first
+PERCENTILES = [0.5, 1, 2.5, 5, 10, 15, 20]
+# added to each side of a range, in H, S and V units
+MARGIN = np.array([3, 10, 10])
+# and in Y, U and V units
+YUV_MARGIN = np.array([10, 5, 5])
+# largest value of each channel
+HSV_MAX = np.array([179, 255, 255])
+YUV_MAX = np.array([255, 255, 255])
+# least share of the samples a fitted range has to cover
+MIN_COVERAGE = 0.5
+
+
+def profile_path(name, profile_dir=PROFILE_DIR):
+    return os.path.join(profile_dir, name + '.json')
+
+
+def list_profiles(profile_dir=PROFILE_DIR):
+    if not os.path.isdir(profile_dir):
+        return []
+    return sorted(f[:-len('.json')] for f in os.listdir(profile_dir) if f.endswith('.json'))
+
+
+def save_profile(name, thresholds, profile_dir=PROFILE_DIR):
+    if not os.path.isdir(profile_dir):
+        os.makedirs(profile_dir)
+    path = profile_path(name, profile_dir)
+    with open(path, 'w') as out_file:
+        json.dump(thresholds, out_file, indent=2, separators=(',', ': '), sort_keys=True)
+    return path
+
+
+'''
+Mask of the largest region that differs between two BGR frames, or None when
+nothing changed
+'''
+def change_mask(before, after, min_diff=40):
+    diff = cv2.absdiff(before, after).max(axis=2)
+    mask = cv2.inRange(diff, min_diff, 255)
+    mask = cv2.erode(mask, None, iterations=1)
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if count < 2:
+        return None
+    largest = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+    return (labels == largest).astype(np.uint8) * 255
+
+
+'''
+One calibration frame: its HSV as the detectors see it, its half resolution
+YUV as the yuv detector sees it, and where the colour being calibrated was,
+so those pixels don't count as false positives
+'''
+class Sample(object):
+
+    def __init__(self, frame, mask):
+        self.hsv = preprocess(frame)
+        self.mask = mask
+        # leave some room around the blob, the blur spreads it
+        self.exclude = cv2.dilate(mask, None, iterations=6) if mask is not None else None
+        height, width = frame.shape[:2]
+        self.yuv = YuvDetector((width, height)).merge(cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420).ravel())
+        half = (width // 2, height // 2)
+        self.yuv_mask = None
+        self.yuv_exclude = None
+        if mask is not None:
+            self.yuv_mask = cv2.resize(mask, half, interpolation=cv2.INTER_NEAREST)
+            self.yuv_exclude = cv2.resize(self.exclude, half, interpolation=cv2.INTER_NEAREST)
+
+    def pixels(self, space='hsv'):
+        if self.mask is None:
+            return np.empty((0, 3), dtype=np.uint8)
+        if space == 'yuv':
+            return self.yuv[self.yuv_mask > 0]
+        return self.hsv[self.mask > 0]
+
+    def false_pixels(self, lower, upper, exclude=True, space='hsv'):
+        if space == 'yuv':
+            mask = yuv_mask(self.yuv, lower, upper)
+            excluded = self.yuv_exclude
+        else:
+            mask = color_mask(self.hsv, lower, upper)
+            excluded = self.exclude
+        if exclude and excluded is not None:
+            mask[excluded > 0] = 0
+        return cv2.countNonZero(mask)
+
+
+'''
+Narrowest range around the sample pixels whose stray pixels over all
+calibration frames stay under max_false_px. The frames of the other colour
+count in full, so the laser range can't match the LEDs and the other way
+round. Ranges covering less than min_coverage of the samples are never
+returned, and None is returned when even the widest one doesn't. `space` is
+'hsv' or 'yuv'.
+
+Red hues straddle 0/180 in OpenCV, so with wrap_hue they are unwrapped above
+180 first. inRange can't wrap, so when the samples still straddle 0 only the
+side holding most of them is kept.
+'''
+def fit_range(samples, others=(), max_false_px=50, wrap_hue=False, min_coverage=MIN_COVERAGE, space='hsv'):
+    margin, top = (YUV_MARGIN, YUV_MAX) if space == 'yuv' else (MARGIN, HSV_MAX)
+    raw = np.concatenate([s.pixels(space) for s in samples]).astype(np.int32)
+    if len(raw) == 0:
+        return None
+    pixels = raw.copy()
+    if wrap_hue:
+        pixels[pixels[:, 0] < 90, 0] += 180
+    best = None
+    for pct in PERCENTILES:
+        lower = np.percentile(pixels, pct, axis=0).astype(np.int32)
+        upper = np.percentile(pixels, 100 - pct, axis=0).astype(np.int32)
+        if wrap_hue:
+            if lower[0] >= 180:
+                lower[0] -= 180
+                upper[0] -= 180
+            elif upper[0] >= 180:
+                if np.count_nonzero(pixels[:, 0] >= 180) * 2 > len(pixels):
+                    lower[0] = 0
+                    upper[0] -= 180
+                else:
+                    upper[0] = 179
+        lower = np.clip(lower - margin, 0, top)
+        upper = np.clip(upper + margin, 0, top)
+        inside = np.all((raw >= lower) & (raw <= upper), axis=1)
+        coverage = float(np.mean(inside))
+        if coverage < min_coverage:
+            # narrower ranges only cover less
+            break
+        false_px = false_pixels(samples, others, lower, upper, space)
+        best = {'lower': lower.tolist(), 'upper': upper.tolist(), 'percentile': pct,
+                'coverage': coverage, 'false_px': int(false_px), 'samples': len(raw)}
+        if false_px <= max_false_px:
+            break
+    return best
+
+
+'''
+Light each LED against a frame with all of them off. Returns a Sample per LED
+found.
+'''
+def sample_leds(gpio, pins, grab_frame, settle_seconds=0.5):
+    for pin in pins:
+        gpio.output(pin, gpio.LOW)
+    time.sleep(settle_seconds)
+    background = grab_frame()
+    samples = [Sample(background, None)]
+    for pin in pins:
+        gpio.output(pin, gpio.HIGH)
+        time.sleep(settle_seconds)
+        frame = grab_frame()
+        gpio.output(pin, gpio.LOW)
+        mask = change_mask(background, frame)
+        if mask is None:
+            print("Could not see the LED on pin " + str(pin))
+        else:
+            samples.append(Sample(frame, mask))
+    return samples
+
+
+'''
+Capture frames while the laser is swept around. The median of the frames is
+the scene without the laser, and each frame's largest difference from it is
+the laser.
+'''
+def sample_laser(grab_frame, sweep_seconds=5.0, frame_interval=0.1):
+    frames = []
+    end = time.time() + sweep_seconds
+    while time.time() < end:
+        frames.append(grab_frame())
+        time.sleep(frame_interval)
+    background = np.median(np.stack(frames), axis=0).astype(np.uint8)
+    samples = [Sample(background, None)]
+    for frame in frames:
+        mask = change_mask(background, frame)
+        if mask is not None:
+            samples.append(Sample(frame, mask))
+    return samples
+
+
+'''
+Stray mask pixels the given ranges produce over the calibration frames
+'''
+def false_pixels(samples, others, lower, upper, space='hsv'):
+    lower = np.array(lower)
+    upper = np.array(upper)
+    return sum(s.false_pixels(lower, upper, space=space) for s in samples) + \
+        sum(o.false_pixels(lower, upper, exclude=False, space=space) for o in others)
+
+
+'''
+Fit both ranges, in HSV and in YUV. Colours without samples, or whose samples
+no range covers well enough, keep their current range. Returns the
+thresholds dict, with the YUV bounds in its 'yuv' section, and a report
+comparing them with the current ranges.
+'''
+def fit_thresholds(laser_samples, led_samples, max_false_px=50, current=None, min_coverage=MIN_COVERAGE):
+    lower_red, upper_red, lower_green, upper_green = hsv_ranges(current)
+    thresholds = {
+        'red': {'lower': lower_red.tolist(), 'upper': upper_red.tolist()},
+        'green': {'lower': lower_green.tolist(), 'upper': upper_green.tolist()}
+    }
+    lower_red, upper_red, lower_green, upper_green = yuv_ranges(current)
+    thresholds['yuv'] = {
+        'red': {'lower': lower_red.tolist(), 'upper': upper_red.tolist()},
+        'green': {'lower': lower_green.tolist(), 'upper': upper_green.tolist()}
+    }
+    report = {}
+    for color, samples, others, wrap_hue in (('red', laser_samples, led_samples, True),
+                                             ('green', led_samples, laser_samples, False)):
+        if len(samples) < 2:
+            continue
+        for space, ranges in (('hsv', thresholds), ('yuv', thresholds['yuv'])):
+            fitted = fit_range(samples, others, max_false_px, wrap_hue and space == 'hsv', min_coverage, space)
+            if fitted is None:
+                print("No " + color + " " + space.upper() + " range covers " + str(int(min_coverage * 100)) +
+                      "% of the samples, keeping the current one")
+                continue
+            previous = ranges[color]
+            fitted['previous_false_px'] = int(false_pixels(samples, others, previous['lower'], previous['upper'],
+                                                           space))
+            ranges[color] = {'lower': fitted['lower'], 'upper': fitted['upper']}
+            report[color + ' ' + space] = fitted
+    return thresholds, report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Calibrate the laser and LED HSV ranges into a named profile.')
+    parser.add_argument('name', nargs='?', help='Profile name, e.g. the room or lighting condition.')
+    parser.add_argument('--profile-dir', dest='profile_dir', default=PROFILE_DIR,
+                        help='Directory the profiles are stored in.')
+    parser.add_argument('--list', dest='list_profiles', action='store_true',
+                        help='List the stored profiles and exit.')
+    parser.add_argument('--source', dest='source', default='picamera', choices=['picamera', 'v4l2'],
+                        help='Where frames come from.')
+    parser.add_argument('--device', dest='device', type=int, default=0,
+                        help='cv2.VideoCapture device index for the v4l2 source.')
+    parser.add_argument('--pins', dest='pins', type=int, nargs='*', default=[4, 18, 23, 24],
+                        help='GPIO pins of the target LEDs.')
+    parser.add_argument('--sweep-seconds', dest='sweep_seconds', type=float, default=5.0,
+                        help='How long to capture frames while the laser is swept.')
+    parser.add_argument('--max-false-px', dest='max_false_px', type=int, default=50,
+                        help='Stray mask pixels allowed over all calibration frames.')
+    parser.add_argument('--min-coverage', dest='min_coverage', type=float, default=MIN_COVERAGE,
+                        help='Least share of the samples a fitted range has to cover.')
+    args = parser.parse_args()
+
+    if args.list_profiles or args.name is None:
+        for name in list_profiles(args.profile_dir):
+            print(name)
+        raise SystemExit(0)
+
+    with open_frame_source(args.source, device=args.device) as source:
+        led_samples = []
+        if gpio is not None and args.pins:
+            gpio.setmode(gpio.BCM)
+            gpio.setwarnings(False)
+            for pin in args.pins:
+                gpio.setup(pin, gpio.OUT)
+            led_samples = sample_leds(gpio, args.pins, source.grab)
+        else:
+            print("No GPIO, keeping the current LED range")
+        print("Sweep the laser across the view for " + str(args.sweep_seconds) + " seconds...")
+        laser_samples = sample_laser(source.grab, args.sweep_seconds)
+
+    thresholds, report = fit_thresholds(laser_samples, led_samples, args.max_false_px,
+                                        min_coverage=args.min_coverage)
+    if not report:
+        print("Nothing was calibrated, not saving profile " + args.name)
+        raise SystemExit(1)
+    for color, fitted in sorted(report.items()):
+        print("%-9s %s - %s  covers %.0f%% of %d samples, %d stray px (was %d)" % (
+            color, fitted['lower'], fitted['upper'], fitted['coverage'] * 100, fitted['samples'],
+            fitted['false_px'], fitted['previous_false_px']))
+    print("Saved profile " + args.name + " to " + save_profile(args.name, thresholds, args.profile_dir))
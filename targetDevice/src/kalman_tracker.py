@@ -0,0 +1,188 @@
+'''
+Constant-velocity Kalman filters for the laser and target centroids. They
+smooth detection jitter, predict where both will be on the next frame and
+let the tracking loop skip full detection while the prediction is good.
+'''
+import numpy as np
+
+H = np.array([[1.0, 0.0, 0.0, 0.0],
+              [0.0, 1.0, 0.0, 0.0]])
+
+
+'''
+Kalman filter over [x, y, vx, vy] for one centroid, in pixels and seconds
+'''
+class KalmanPoint(object):
+
+    def __init__(self, accel_var=2000.0, measurement_var=9.0):
+        # variance of the unmodelled acceleration, in (px/s^2)^2
+        self.accel_var = accel_var
+        self.R = np.eye(2) * measurement_var
+        self.F = np.eye(4)
+        self.Q = np.zeros((4, 4))
+        self.x = np.zeros(4)
+        self.P = np.eye(4)
+        self.initialized = False
+        self.missed = 0
+
+    def reset(self):
+        self.initialized = False
+        self.missed = 0
+
+    def predict(self, dt):
+        if not self.initialized:
+            return None
+        self.F[0, 2] = self.F[1, 3] = dt
+        # discrete white noise acceleration model
+        dt2 = dt * dt
+        q = self.accel_var
+        self.Q[0, 0] = self.Q[1, 1] = q * dt2 * dt2 / 4.0
+        self.Q[0, 2] = self.Q[2, 0] = self.Q[1, 3] = self.Q[3, 1] = q * dt2 * dt / 2.0
+        self.Q[2, 2] = self.Q[3, 3] = q * dt2
+        self.x = self.F.dot(self.x)
+        self.P = self.F.dot(self.P).dot(self.F.T) + self.Q
+        return self.x[:2]
+
+    '''
+    Correct the state with a measured centroid. Returns the distance between
+    the prediction and the measurement, or None for the first measurement.
+    '''
+    def update(self, z):
+        z = np.asarray(z, dtype=float)
+        self.missed = 0
+        if not self.initialized:
+            self.x[:] = (z[0], z[1], 0.0, 0.0)
+            self.P = np.diag([self.R[0, 0], self.R[1, 1], 1000.0, 1000.0])
+            self.initialized = True
+            return None
+        innovation = z - H.dot(self.x)
+        S = H.dot(self.P).dot(H.T) + self.R
+        K = self.P.dot(H.T).dot(np.linalg.inv(S))
+        self.x = self.x + K.dot(innovation)
+        self.P = (np.eye(4) - K.dot(H)).dot(self.P)
+        return float(np.hypot(innovation[0], innovation[1]))
+
+    def position_std(self):
+        return float(np.sqrt(max(self.P[0, 0], self.P[1, 1])))
+
+    def position(self):
+        return (int(round(self.x[0])), int(round(self.x[1])))
+
+
+'''
+Tracks the laser and target centroids and decides when a frame can be
+skipped. Prediction errors are kept in a fixed-size ring for reporting.
+'''
+class KalmanTracker(object):
+
+    def __init__(self, max_skip=2, max_std_px=4.0, max_error_px=6.0, error_window=128, max_missed=5):
+        self.laser = KalmanPoint()
+        self.target = KalmanPoint()
+        # never skip more than this many frames in a row
+        self.max_skip = max_skip
+        # predictions are trusted while the position std and the recent
+        # prediction errors stay under these limits
+        self.max_std_px = max_std_px
+        self.max_error_px = max_error_px
+        # frames without a detection before a filter is reset
+        self.max_missed = max_missed
+        self.errors = np.zeros(error_window)
+        self.error_count = 0
+        self.last_time = None
+        self.skipped_in_row = 0
+        self.frames = 0
+        self.skipped = 0
+        self.radii = (0, 0)
+
+    def _advance(self, now):
+        dt = 0.0 if self.last_time is None else now - self.last_time
+        self.last_time = now
+        self.laser.predict(dt)
+        self.target.predict(dt)
+
+    def _record_error(self, error):
+        if error is None:
+            return
+        self.errors[self.error_count % len(self.errors)] = error
+        self.error_count += 1
+
+    def _recent_errors(self):
+        return self.errors[:min(self.error_count, len(self.errors))]
+
+    def _located(self):
+        laser = self.laser.position() if self.laser.initialized else None
+        target = self.target.position() if self.target.initialized else None
+        return laser, self.radii[0], target, self.radii[1]
+
+    '''
+    True when the prediction can stand in for detection on this frame: both
+    filters are confident, recent errors are small and no command is due.
+    '''
+    def can_skip(self, command_pending):
+        if command_pending or self.skipped_in_row >= self.max_skip:
+            return False
+        if not (self.laser.initialized and self.target.initialized):
+            return False
+        if max(self.laser.position_std(), self.target.position_std()) > self.max_std_px:
+            return False
+        errors = self._recent_errors()
+        return len(errors) >= 8 and np.percentile(errors, 95) < self.max_error_px
+
+    '''
+    Advance both filters to `now` without a measurement and return the
+    predicted (laser, laser_radius, target, target_radius).
+    '''
+    def predict(self, now):
+        self.frames += 1
+        self.skipped += 1
+        self.skipped_in_row += 1
+        self._advance(now)
+        return self._located()
+
+    '''
+    Correct both filters with a detection result and return the smoothed
+    (laser, laser_radius, target, target_radius).
+    '''
+    def update(self, now, located):
+        self.frames += 1
+        self.skipped_in_row = 0
+        self._advance(now)
+        red_center, red_radius, green_center, green_radius = located
+        for point, center in ((self.laser, red_center), (self.target, green_center)):
+            if center is None:
+                point.missed += 1
+                if point.missed > self.max_missed:
+                    point.reset()
+            else:
+                self._record_error(point.update(center))
+        self.radii = (red_radius, green_radius)
+        laser, _, target, _ = self._located()
+        # a point that is not currently seen should not drive commands
+        if red_center is None:
+            laser = None
+        if green_center is None:
+            target = None
+        return laser, red_radius, target, green_radius
+
+    '''
+    A new LED was lit somewhere else, so start the target filter afresh
+    rather than letting it glide over from the old one
+    '''
+    def forget_target(self):
+        self.target.reset()
+
+    def stats(self):
+        errors = self._recent_errors()
+        frames = max(self.frames, 1)
+        stats = {
+            'frames': self.frames,
+            'skipped': self.skipped,
+            'skip_rate': float(self.skipped) / frames,
+            'error_samples': self.error_count
+        }
+        if len(errors) > 0:
+            stats['error_mean_px'] = float(np.mean(errors))
+            stats['error_p50_px'] = float(np.percentile(errors, 50))
+            stats['error_p95_px'] = float(np.percentile(errors, 95))
+            stats['error_max_px'] = float(np.max(errors))
+        return stats
@@ -0,0 +1,445 @@
+'''
+Colour blob detection for the laser dot and the target LEDs, kept free of
+any camera or GPIO imports so it can be reused by the different detector
+modes in track_laser.py.
+'''
+import os
+import json
+import cv2
+import numpy as np
+import stage_timing
+
+# HSV boundaries tuned with the range-detector tool
+LOWER_RED = np.array([166, 31, 122])
+UPPER_RED = np.array([250, 250, 255])
+LOWER_GREEN = np.array([40, 15, 140])
+UPPER_GREEN = np.array([100, 255, 255])
+
+BLUR_KERNEL = (11, 11)
+
+'''
+(lower red, upper red, lower green, upper green) arrays for a thresholds
+dict as saved by range-detector or hsv_calibration.py, or the defaults above
+for None. The detectors take these as their `ranges` argument.
+'''
+def hsv_ranges(thresholds=None):
+    if thresholds is None:
+        return LOWER_RED, UPPER_RED, LOWER_GREEN, UPPER_GREEN
+    red = thresholds['red']
+    green = thresholds['green']
+    return (np.array(red['lower']), np.array(red['upper']),
+            np.array(green['lower']), np.array(green['upper']))
+
+def default_thresholds():
+    return {
+        'red': {'lower': LOWER_RED.tolist(), 'upper': UPPER_RED.tolist()},
+        'green': {'lower': LOWER_GREEN.tolist(), 'upper': UPPER_GREEN.tolist()}
+    }
+
+'''
+Read HSV ranges saved by `range-detector --output`. Colours missing from the
+file keep their default range.
+'''
+def load_thresholds(path):
+    thresholds = default_thresholds()
+    if path is not None and os.path.isfile(path):
+        with open(path, 'r') as in_file:
+            thresholds.update(json.load(in_file))
+    return thresholds
+
+'''
+Blur a BGR image to smooth edges of shapes and convert it to HSV
+'''
+def preprocess(frame, kernel=BLUR_KERNEL):
+    t = stage_timing.timer.mark()
+    blurred = cv2.GaussianBlur(frame, kernel, 0)
+    t = stage_timing.timer.record('blur', t)
+    hsv = cv2.cvtColor(blurred, cv2.COLOR_BGR2HSV)
+    stage_timing.timer.record('convert', t)
+    return hsv
+
+'''
+Construct a mask for the colour range, then perform a series of erosions
+and dilations to remove any small blobs left in the mask
+'''
+def color_mask(hsv, lower, upper, iterations=2):
+    t = stage_timing.timer.mark()
+    mask = cv2.inRange(hsv, lower, upper)
+    t = stage_timing.timer.record('threshold', t)
+    mask = cv2.erode(mask, None, iterations=iterations)
+    mask = cv2.dilate(mask, None, iterations=iterations)
+    stage_timing.timer.record('morphology', t)
+    return mask
+
+# One row per blob found in a mask, as returned by extract_blobs()
+BLOB_DTYPE = np.dtype([
+    ('area', np.int32),
+    ('left', np.int32),
+    ('top', np.int32),
+    ('width', np.int32),
+    ('height', np.int32),
+    ('cx', np.float32),
+    ('cy', np.float32)
+])
+
+'''
+Label a binary mask in one connected-components pass and return every blob as
+a BLOB_DTYPE structured array, largest first. Only the bounding box of the
+set pixels is labelled, which is usually a small part of the frame. Blobs
+smaller than `min_area` pixels are left out. A preallocated int32 `labels`
+image at least as large as the mask can be passed in to avoid allocating one
+per call.
+'''
+def extract_blobs(mask, min_area=0, labels=None):
+    x, y, width, height = cv2.boundingRect(mask)
+    if width == 0 or height == 0:
+        return np.empty(0, dtype=BLOB_DTYPE)
+    if labels is None or labels.size < width * height:
+        labels = np.empty((height, width), dtype=np.int32)
+    else:
+        # a contiguous view of the start of the buffer, sized to the crop
+        labels = labels.reshape(-1)[:width * height].reshape(height, width)
+    count, labels, stats, centroids = cv2.connectedComponentsWithStatsWithAlgorithm(
+        mask[y:y + height, x:x + width], 8, cv2.CV_32S, cv2.CCL_BBDT, labels=labels)
+    # component 0 is the background
+    blobs = np.empty(count - 1, dtype=BLOB_DTYPE)
+    blobs['area'] = stats[1:, cv2.CC_STAT_AREA]
+    blobs['left'] = stats[1:, cv2.CC_STAT_LEFT] + x
+    blobs['top'] = stats[1:, cv2.CC_STAT_TOP] + y
+    blobs['width'] = stats[1:, cv2.CC_STAT_WIDTH]
+    blobs['height'] = stats[1:, cv2.CC_STAT_HEIGHT]
+    blobs['cx'] = centroids[1:, 0] + x
+    blobs['cy'] = centroids[1:, 1] + y
+    if min_area > 0:
+        blobs = blobs[blobs['area'] >= min_area]
+    return blobs[np.argsort(-blobs['area'], kind='mergesort')]
+
+'''
+Centroid and an approximate enclosing radius for one blob. Half the bounding
+box diagonal stands in for the minimum enclosing circle.
+'''
+def blob_center(blob):
+    center = (int(blob['cx']), int(blob['cy']))
+    radius = 0.5 * float(np.hypot(blob['width'], blob['height']))
+    return center, radius
+
+'''
+Find the largest contour in a mask and return its centroid and the radius of
+its minimum enclosing circle, or (None, 0) when the mask is empty. Tracing the
+outer contours is cheaper than labelling every pixel when only one blob is
+wanted.
+'''
+def largest_blob(mask):
+    t = stage_timing.timer.mark()
+    cnts = cv2.findContours(mask, cv2.RETR_EXTERNAL,
+        cv2.CHAIN_APPROX_SIMPLE)[-2]
+    stage_timing.timer.record('contours', t)
+    if len(cnts) == 0:
+        return None, 0
+
+    c = max(cnts, key=cv2.contourArea)
+    ((x, y), radius) = cv2.minEnclosingCircle(c)
+    M = cv2.moments(c)
+    if "m00" in M and M["m00"] > 0:
+        center = (int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"]))
+    else:
+        center = (int(x), int(y))
+    return center, radius
+
+'''
+Run the full-frame detection for both colours on a BGR frame. The green
+search can be skipped when the target position is already known.
+Returns (red_center, red_radius, green_center, green_radius).
+'''
+def find_laser_and_target(frame, find_target=True, ranges=None):
+    lower_red, upper_red, lower_green, upper_green = ranges if ranges is not None else hsv_ranges()
+    hsv = preprocess(frame)
+    red_center, red_radius = largest_blob(color_mask(hsv, lower_red, upper_red))
+    green_center, green_radius = None, 0
+    if find_target:
+        green_center, green_radius = largest_blob(color_mask(hsv, lower_green, upper_green))
+    return red_center, red_radius, green_center, green_radius
+
+'''
+Every red and green blob in the frame, for callers that want to pick blobs
+by size or position rather than just the largest of each colour. `labels`
+is a reusable int32 buffer as for extract_blobs().
+Returns (red_blobs, green_blobs) as BLOB_DTYPE arrays.
+'''
+def find_all_blobs(frame, min_area=0, ranges=None, labels=None):
+    lower_red, upper_red, lower_green, upper_green = ranges if ranges is not None else hsv_ranges()
+    hsv = preprocess(frame)
+    red_blobs = extract_blobs(color_mask(hsv, lower_red, upper_red), min_area, labels)
+    green_blobs = extract_blobs(color_mask(hsv, lower_green, upper_green), min_area, labels)
+    return red_blobs, green_blobs
+
+'''
+Clamp a square window of half-size `half` around `center` to the frame bounds.
+Returns (x0, y0, x1, y1).
+'''
+def window_around(center, half, shape):
+    height, width = shape[:2]
+    x0 = max(0, int(center[0]) - half)
+    y0 = max(0, int(center[1]) - half)
+    x1 = min(width, int(center[0]) + half)
+    y1 = min(height, int(center[1]) + half)
+    return x0, y0, x1, y1
+
+'''
+Detect the largest blob of one colour inside a window of a BGR frame.
+The returned centroid is in full-frame pixel coordinates.
+'''
+def find_in_window(frame, window, lower, upper):
+    x0, y0, x1, y1 = window
+    hsv = preprocess(frame[y0:y1, x0:x1])
+    center, radius = largest_blob(color_mask(hsv, lower, upper))
+    if center is not None:
+        center = (center[0] + x0, center[1] + y0)
+    return center, radius
+
+
+'''
+Tracks the laser and the lit LED inside small windows around their last known
+positions, and only falls back to a full-frame search when it loses lock on
+either of them.
+'''
+class RoiDetector(object):
+
+    def __init__(self, window_px=160, ranges=None):
+        # Half the side of the square search window, in pixels
+        self.window_px = window_px
+        self.ranges = ranges if ranges is not None else hsv_ranges()
+        self.red_center = None
+        self.green_center = None
+        self.frames = 0
+        self.reacquisitions = 0
+        self.last_pixel_count = 0
+        self.total_pixel_count = 0
+
+    def reset(self):
+        self.red_center = None
+        self.green_center = None
+
+    def locate(self, frame, find_target=True):
+        self.frames += 1
+        pixels = 0
+        red = (None, 0)
+        green = (None, 0)
+        lower_red, upper_red, lower_green, upper_green = self.ranges
+
+        if self.red_center is not None:
+            window = window_around(self.red_center, self.window_px, frame.shape)
+            red = find_in_window(frame, window, lower_red, upper_red)
+            pixels += (window[2] - window[0]) * (window[3] - window[1])
+        if find_target and self.green_center is not None:
+            window = window_around(self.green_center, self.window_px, frame.shape)
+            green = find_in_window(frame, window, lower_green, upper_green)
+            pixels += (window[2] - window[0]) * (window[3] - window[1])
+
+        if red[0] is None or (find_target and green[0] is None):
+            # Lost lock on one of them, so search the whole frame again
+            self.reacquisitions += 1
+            red_center, red_radius, green_center, green_radius = find_laser_and_target(
+                frame, find_target=find_target and green[0] is None, ranges=self.ranges)
+            if red[0] is None:
+                red = (red_center, red_radius)
+            if green[0] is None:
+                green = (green_center, green_radius)
+            pixels += frame.shape[0] * frame.shape[1]
+
+        self.red_center = red[0]
+        self.green_center = green[0]
+        self.last_pixel_count = pixels
+        self.total_pixel_count += pixels
+        return red[0], red[1], green[0], green[1]
+
+    def stats(self):
+        frames = max(self.frames, 1)
+        return {
+            'frames': self.frames,
+            'reacquisitions': self.reacquisitions,
+            'reacquisition_rate': float(self.reacquisitions) / frames,
+            'last_pixel_count': self.last_pixel_count,
+            'mean_pixel_count': float(self.total_pixel_count) / frames
+        }
+
+    def forget_target(self):
+        self.green_center = None
+
+
+'''
+Finds candidate laser and LED blobs on a downsampled copy of the frame, then
+refines each centroid at full resolution inside a small patch. All returned
+coordinates and radii are in full-resolution pixels.
+'''
+class PyramidDetector(object):
+
+    def __init__(self, scale=4, min_patch_px=32, ranges=None):
+        self.scale = scale
+        # Smallest half-size of the full resolution refinement patch
+        self.min_patch_px = min_patch_px
+        self.ranges = ranges if ranges is not None else hsv_ranges()
+
+    def coarse(self, frame, find_target=True):
+        height, width = frame.shape[:2]
+        # area interpolation averages each block, which does most of the
+        # smoothing the full resolution blur was doing
+        small = cv2.resize(frame, (width // self.scale, height // self.scale),
+                           interpolation=cv2.INTER_AREA)
+        hsv = preprocess(small, kernel=(3, 3))
+        # a laser dot is only a few pixels wide at this scale, so skip the
+        # erode/dilate passes and let the full resolution refinement clean up
+        lower_red, upper_red, lower_green, upper_green = self.ranges
+        red = largest_blob(cv2.inRange(hsv, lower_red, upper_red))
+        green = (None, 0)
+        if find_target:
+            green = largest_blob(cv2.inRange(hsv, lower_green, upper_green))
+        return red, green
+
+    def refine(self, frame, coarse_blob, lower, upper):
+        center, radius = coarse_blob
+        if center is None:
+            return None, 0
+        full_center = (center[0] * self.scale + self.scale // 2,
+                       center[1] * self.scale + self.scale // 2)
+        full_radius = radius * self.scale
+        half = max(self.min_patch_px, int(full_radius * 2))
+        window = window_around(full_center, half, frame.shape)
+        refined = find_in_window(frame, window, lower, upper)
+        if refined[0] is None:
+            # morphology removed the blob at full resolution, so keep the
+            # coarse estimate rather than losing it
+            return full_center, full_radius
+        return refined
+
+    def locate(self, frame, find_target=True):
+        red, green = self.coarse(frame, find_target)
+        lower_red, upper_red, lower_green, upper_green = self.ranges
+        red_center, red_radius = self.refine(frame, red, lower_red, upper_red)
+        green_center, green_radius = self.refine(frame, green, lower_green, upper_green)
+        return red_center, red_radius, green_center, green_radius
+
+    def forget_target(self):
+        pass
+
+
+# Default YUV boundaries as (Y, U, V), for when no profile has calibrated
+# them. The laser has a high V (red difference) but red only carries about
+# 30% of the luma, and the LED is bright with both U and V below neutral.
+LOWER_RED_YUV = np.array([60, 0, 160])
+UPPER_RED_YUV = np.array([255, 255, 255])
+LOWER_GREEN_YUV = np.array([140, 0, 0])
+UPPER_GREEN_YUV = np.array([255, 125, 120])
+
+'''
+(lower red, upper red, lower green, upper green) YUV bounds from the 'yuv'
+section of a thresholds dict, as fitted by hsv_calibration.py, or the
+defaults above when it has none. YuvDetector takes these as its `ranges`.
+'''
+def yuv_ranges(thresholds=None):
+    if thresholds is None or 'yuv' not in thresholds:
+        return LOWER_RED_YUV, UPPER_RED_YUV, LOWER_GREEN_YUV, UPPER_GREEN_YUV
+    red = thresholds['yuv']['red']
+    green = thresholds['yuv']['green']
+    return (np.array(red['lower']), np.array(red['upper']),
+            np.array(green['lower']), np.array(green['upper']))
+
+'''
+Mask of one colour in a half resolution (Y, U, V) image from
+YuvDetector.merge(), with the morphology YuvDetector.locate() uses
+'''
+def yuv_mask(yuv, lower, upper):
+    mask = cv2.inRange(yuv, lower, upper)
+    mask = cv2.erode(mask, None, iterations=1)
+    mask = cv2.dilate(mask, None, iterations=1)
+    return mask
+
+
+'''
+Classifies the laser and the LED straight from the planes of a YUV420 frame
+captured with format='yuv', at the half resolution of the chroma planes. This
+skips the full-frame blur and BGR to HSV conversion, and all intermediate
+images are preallocated and reused.
+'''
+class YuvDetector(object):
+
+    def __init__(self, resolution, ranges=None):
+        width, height = resolution
+        self.ranges = ranges if ranges is not None else yuv_ranges()
+        self.width = width
+        self.height = height
+        self.half_size = (width // 2, height // 2)
+        half_shape = (height // 2, width // 2)
+        self.y_half = np.empty(half_shape, dtype=np.uint8)
+        self.plane_mask = np.empty(half_shape, dtype=np.uint8)
+        self.red_mask = np.empty(half_shape, dtype=np.uint8)
+        self.green_mask = np.empty(half_shape, dtype=np.uint8)
+        self.morph_tmp = np.empty(half_shape, dtype=np.uint8)
+
+    '''
+    Number of bytes in one YUV420 frame, for preallocating capture buffers
+    '''
+    def frame_bytes(self):
+        return self.width * self.height * 3 // 2
+
+    '''
+    Split a flat YUV420 buffer into Y, U and V plane views, without copying
+    '''
+    def planes(self, frame):
+        y_size = self.width * self.height
+        c_size = y_size // 4
+        half_h, half_w = self.height // 2, self.width // 2
+        y = frame[:y_size].reshape(self.height, self.width)
+        u = frame[y_size:y_size + c_size].reshape(half_h, half_w)
+        v = frame[y_size + c_size:y_size + 2 * c_size].reshape(half_h, half_w)
+        return y, u, v
+
+    '''
+    The planes of a YUV420 frame as one (Y, U, V) image at the chroma
+    resolution, the pixels locate() classifies
+    '''
+    def merge(self, frame):
+        y, u, v = self.planes(frame)
+        y_half = cv2.resize(y, self.half_size, interpolation=cv2.INTER_AREA)
+        return cv2.merge([y_half, u, v])
+
+    def _classify(self, u, v, lower, upper, out):
+        t = stage_timing.timer.mark()
+        cv2.inRange(self.y_half, int(lower[0]), int(upper[0]), dst=out)
+        cv2.inRange(u, int(lower[1]), int(upper[1]), dst=self.plane_mask)
+        cv2.bitwise_and(out, self.plane_mask, dst=out)
+        cv2.inRange(v, int(lower[2]), int(upper[2]), dst=self.plane_mask)
+        cv2.bitwise_and(out, self.plane_mask, dst=out)
+        t = stage_timing.timer.record('threshold', t)
+        # one iteration at half resolution covers about as much as the
+        # two full resolution iterations on the BGR path
+        cv2.erode(out, None, dst=self.morph_tmp, iterations=1)
+        cv2.dilate(self.morph_tmp, None, dst=out, iterations=1)
+        stage_timing.timer.record('morphology', t)
+        center, radius = largest_blob(out)
+        if center is None:
+            return None, 0
+        # back to full resolution pixels
+        return (center[0] * 2, center[1] * 2), radius * 2
+
+    def locate(self, frame, find_target=True):
+        y, u, v = self.planes(frame)
+        # bring luma down to the chroma resolution
+        t = stage_timing.timer.mark()
+        cv2.resize(y, self.half_size, dst=self.y_half, interpolation=cv2.INTER_AREA)
+        stage_timing.timer.record('convert', t)
+        lower_red, upper_red, lower_green, upper_green = self.ranges
+        red_center, red_radius = self._classify(u, v, lower_red, upper_red, self.red_mask)
+        green_center, green_radius = None, 0
+        if find_target:
+            green_center, green_radius = self._classify(u, v, lower_green, upper_green, self.green_mask)
+        return red_center, red_radius, green_center, green_radius
+
+    '''
+    Convert a YUV420 frame to BGR. Only needed to display it.
+    '''
+    def to_bgr(self, frame):
+        return cv2.cvtColor(frame.reshape(self.height * 3 // 2, self.width), cv2.COLOR_YUV2BGR_I420)
+
+    def forget_target(self):
+        pass
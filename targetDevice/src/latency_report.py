@@ -0,0 +1,103 @@
+#! /usr/bin/env python
+'''
+Rebuilds each command's timeline from the TRACE lines written by
+track_laser.py --trace-log, the fulfilment Lambda (CloudWatch export) and
+laser_guidance_thing.py, and reports where the time between the frame that
+triggered a command and the camera seeing the laser move goes.
+
+Hops from different machines are compared directly, so their clocks need to
+be NTP synced for the cross-device segments to mean anything.
+
+    python latency_report.py trace.log lambda.log thing.log
+'''
+import argparse
+import json
+import numpy as np
+from latency_trace import PREFIX
+
+# the order hops normally happen in, used to label segments
+HOPS = ['frame', 'decided', 'dequeued', 'expired', 'polly_done', 'lex_sent', 'lambda_start', 'shadow_update_sent',
+        'shadow_received', 'moved', 'lex_response', 'motion_observed']
+
+
+'''
+Collect hops from every TRACE line in the given files, by trace ID
+'''
+def read_traces(paths):
+    traces = {}
+    for path in paths:
+        with open(path, 'r') as in_file:
+            for line in in_file:
+                start = line.find(PREFIX)
+                if start < 0:
+                    continue
+                try:
+                    record = json.loads(line[start + len(PREFIX):])
+                except ValueError:
+                    continue
+                traces.setdefault(record['trace_id'], []).append(record)
+    for hops in traces.values():
+        hops.sort(key=lambda record: record['t'])
+    return traces
+
+
+'''
+Milliseconds between consecutive hops of one trace, plus the end-to-end total
+'''
+def segments(hops):
+    result = []
+    for prev, cur in zip(hops, hops[1:]):
+        result.append((prev['hop'] + ' -> ' + cur['hop'], (cur['t'] - prev['t']) * 1000.0))
+    if len(hops) > 1:
+        result.append(('total', (hops[-1]['t'] - hops[0]['t']) * 1000.0))
+    return result
+
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'mean_ms': float(np.mean(values)),
+        'p50_ms': float(np.percentile(values, 50)),
+        'p95_ms': float(np.percentile(values, 95))
+    }
+
+
+def segment_order(name):
+    if name == 'total':
+        return (len(HOPS), name)
+    first = name.split(' -> ')[0]
+    return (HOPS.index(first) if first in HOPS else len(HOPS) - 1, name)
+
+
+def report(traces, verbose=False):
+    by_segment = {}
+    for trace_id, hops in sorted(traces.items(), key=lambda item: item[1][0]['t']):
+        command_segments = segments(hops)
+        if verbose:
+            command = next((h['command'] for h in hops if 'command' in h), '?')
+            print(trace_id + " " + command)
+            for name, ms in command_segments:
+                print("    %-40s %9.1f ms" % (name, ms))
+        for name, ms in command_segments:
+            by_segment.setdefault(name, []).append(ms)
+    return [(name, summarize(by_segment[name])) for name in sorted(by_segment, key=segment_order)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Break down end-to-end command latency from trace logs.')
+    parser.add_argument('logs', nargs='+', help='Log files containing TRACE lines.')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Print the timeline of every command as well.')
+    parser.add_argument('--json', dest='json_output', action='store_true',
+                        help='Print the aggregate as JSON instead of a table.')
+    args = parser.parse_args()
+
+    traces = read_traces(args.logs)
+    summary = report(traces, args.verbose)
+    if args.json_output:
+        print(json.dumps(dict(summary), indent=2, sort_keys=True))
+    else:
+        print(str(len(traces)) + " commands traced")
+        print("%-40s %6s %9s %9s %9s" % ('segment', 'count', 'mean ms', 'p50 ms', 'p95 ms'))
+        for name, s in summary:
+            print("%-40s %6d %9.1f %9.1f %9.1f" % (name, s['count'], s['mean_ms'], s['p50_ms'], s['p95_ms']))
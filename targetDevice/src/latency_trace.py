@@ -0,0 +1,52 @@
+'''
+Correlation IDs and hop timestamps for following a single correction from
+the frame that triggered it, through Polly, Lex, the fulfilment Lambda, the
+IoT shadow and the pan/tilt head, to the camera seeing the laser move.
+
+Every hop is written as one JSON line prefixed with TRACE, e.g.
+
+    TRACE {"hop": "lex_sent", "t": 1508245123.512, "trace_id": "3f2a..."}
+
+The Lambda and the targeting device log the same kind of line, so
+latency_report.py can rebuild each command's timeline from all the logs.
+'''
+import json
+import threading
+import time
+import uuid
+
+PREFIX = 'TRACE '
+
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+
+class LatencyTracer(object):
+
+    '''
+    Writes hops to `path`, or prints them when no path is given
+    '''
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.out_file = open(path, 'a') if path is not None else None
+
+    def hop(self, trace_id, hop, t=None, **extra):
+        if trace_id is None:
+            return
+        record = dict(extra)
+        record['trace_id'] = trace_id
+        record['hop'] = hop
+        record['t'] = t if t is not None else time.time()
+        line = PREFIX + json.dumps(record, sort_keys=True)
+        with self.lock:
+            if self.out_file is not None:
+                self.out_file.write(line + '\n')
+                self.out_file.flush()
+            else:
+                print(line)
+
+    def close(self):
+        if self.out_file is not None:
+            self.out_file.close()
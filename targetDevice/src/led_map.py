@@ -0,0 +1,109 @@
+'''
+Persisted map of where each target LED sits in the camera frame. The LEDs
+never move, so once they have been located the tracker can look up the lit
+one instead of building a green mask on every frame.
+'''
+import os
+import json
+import time
+from laser_detection import (preprocess, color_mask, largest_blob, window_around,
+                             find_in_window, hsv_ranges)
+
+
+class LedMap(object):
+
+    def __init__(self, path='led_map.json', check_interval=30, check_window_px=40, ranges=None):
+        self.path = path
+        # only the green bounds are used
+        self.lower_green, self.upper_green = (ranges if ranges is not None else hsv_ranges())[2:]
+        # How many lookups of a pin between sanity checks of its position
+        self.check_interval = check_interval
+        # Half-size of the window searched by the sanity check
+        self.check_window_px = check_window_px
+        self.positions = {}
+        # pin -> lookups so far, so every pin gets checked however the
+        # lookups of several heads interleave
+        self.lookups = {}
+        self.failed_checks = 0
+
+    def load(self):
+        if os.path.exists(self.path) and os.path.isfile(self.path):
+            try:
+                with open(self.path, 'r') as in_file:
+                    self.positions = json.load(in_file)
+                print("Loaded LED positions from " + self.path)
+            except (OSError, IOError, ValueError) as e:
+                print("Could not read LED map " + self.path + ": " + str(e))
+        return self.positions
+
+    def save(self):
+        with open(self.path, 'w') as out_file:
+            json.dump(self.positions, out_file, indent=2,
+                      separators=(',', ': '), sort_keys=True)
+
+    def has_all(self, pins):
+        return all(str(pin) in self.positions for pin in pins)
+
+    '''
+    Mapped (x, y) of the LED on a pin, or None when it isn't mapped
+    '''
+    def position(self, pin):
+        entry = self.positions.get(str(pin))
+        if entry is None:
+            return None
+        return entry['x'], entry['y']
+
+    '''
+    Locate the largest green blob in the whole frame and store it for a pin.
+    Returns the stored entry, or None if no green blob was found.
+    '''
+    def record(self, pin, frame):
+        hsv = preprocess(frame)
+        center, radius = largest_blob(color_mask(hsv, self.lower_green, self.upper_green))
+        if center is None:
+            return None
+        entry = {'x': int(center[0]), 'y': int(center[1]), 'radius': float(radius)}
+        self.positions[str(pin)] = entry
+        return entry
+
+    '''
+    Light each LED in turn, the way identify_leds.py does, and record where it
+    shows up. `grab_frame` must return a fresh BGR frame from the camera.
+    '''
+    def calibrate(self, gpio, pins, grab_frame, settle_seconds=0.5):
+        for pin in pins:
+            gpio.output(pin, gpio.LOW)
+        for pin in pins:
+            gpio.output(pin, gpio.HIGH)
+            time.sleep(settle_seconds)
+            entry = self.record(pin, grab_frame())
+            gpio.output(pin, gpio.LOW)
+            if entry is None:
+                print("Could not find LED on pin " + str(pin) + " during calibration")
+            else:
+                print("LED on pin " + str(pin) + " is at " + str((entry['x'], entry['y'])))
+        self.save()
+
+    '''
+    Return ((x, y), radius) for the lit LED. Every `check_interval` lookups of
+    the pin a small window around its mapped position is checked for green,
+    and the full-frame green search only runs when that check fails.
+    '''
+    def lookup(self, pin, frame):
+        self.lookups[pin] = self.lookups.get(pin, 0) + 1
+        entry = self.positions.get(str(pin))
+        if entry is not None and self.lookups[pin] % self.check_interval == 0:
+            window = window_around((entry['x'], entry['y']), self.check_window_px, frame.shape)
+            center, radius = find_in_window(frame, window, self.lower_green, self.upper_green)
+            if center is None:
+                self.failed_checks += 1
+                print("LED on pin " + str(pin) + " not found at its mapped position. Searching again...")
+                entry = None
+
+        if entry is None:
+            entry = self.record(pin, frame)
+            if entry is None:
+                return None, 0
+            self.save()
+
+        return (entry['x'], entry['y']), entry['radius']
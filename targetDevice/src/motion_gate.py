@@ -0,0 +1,155 @@
+'''
+Skips full detection on frames where nothing in view has changed, and lowers
+the camera frame rate while the scene stays still.
+
+MotionGate compares a tiny downsampled greyscale copy of each frame with the
+copy from the last frame that was fully processed. A parked laser and a
+steady target LED give nearly identical copies, so the frame can reuse the
+previous detection.
+
+FrameRateGovernor drops the source to an idle frame rate after a few quiet
+seconds, and restores the full rate as soon as something moves or a command
+is dictated.
+'''
+import time
+import cv2
+import numpy as np
+
+
+'''
+CPU seconds used by this process so far
+'''
+def cpu_time():
+    try:
+        return time.process_time()
+    except AttributeError:
+        # python 2
+        return time.clock()
+
+
+class MotionGate(object):
+
+    def __init__(self, resolution=(1280, 960), size=(80, 60), pixel_threshold=6, min_changed=1,
+                 max_idle=2.0, report_interval=60.0):
+        self.resolution = resolution
+        self.size = size
+        # a small pixel counts as changed when its grey level moves by more
+        # than this, and a frame when at least min_changed pixels did
+        self.pixel_threshold = pixel_threshold
+        self.min_changed = min_changed
+        # always process a frame after this many seconds, so slow drift
+        # (daylight, auto exposure) is eventually picked up
+        self.max_idle = max_idle
+        self.report_interval = report_interval
+        self.small = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        self.grey = np.empty((size[1], size[0]), dtype=np.uint8)
+        self.reference = np.empty((size[1], size[0]), dtype=np.uint8)
+        self.diff = np.empty((size[1], size[0]), dtype=np.uint8)
+        self.has_reference = False
+        self.last_processed = 0
+        # whether the last frame actually changed, rather than only being due
+        # a refresh after max_idle
+        self.moved = False
+        self.frames = 0
+        self.skipped = 0
+        self.processed_cpu = 0.0
+        self.processed = 0
+        self.next_report = time.time() + report_interval if report_interval else None
+        self.report_skipped = 0
+        self.report_uncaptured = 0.0
+
+    def _downsample(self, frame):
+        if frame.ndim == 1:
+            # flat YUV420, the Y plane comes first and is already grey
+            y_plane = frame[:self.resolution[0] * self.resolution[1]].reshape(
+                self.resolution[1], self.resolution[0])
+            cv2.resize(y_plane, self.size, dst=self.grey, interpolation=cv2.INTER_AREA)
+        else:
+            cv2.resize(frame, self.size, dst=self.small, interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, dst=self.grey)
+        return self.grey
+
+    '''
+    Whether the frame needs full detection. A frame that does becomes the
+    reference the following frames are compared with.
+    '''
+    def changed(self, frame, now=None):
+        now = now if now is not None else time.time()
+        self.frames += 1
+        grey = self._downsample(frame)
+        self.moved = True
+        if self.has_reference:
+            cv2.absdiff(grey, self.reference, self.diff)
+            cv2.threshold(self.diff, self.pixel_threshold, 255, cv2.THRESH_BINARY, dst=self.diff)
+            self.moved = cv2.countNonZero(self.diff) >= self.min_changed
+            if not self.moved and now - self.last_processed < self.max_idle:
+                self.skipped += 1
+                self.report_skipped += 1
+                return False
+        np.copyto(self.reference, grey)
+        self.has_reference = True
+        self.last_processed = now
+        return True
+
+    '''
+    Account the CPU time spent fully processing a frame, from a cpu_time() mark
+    '''
+    def processed_frame(self, cpu_start):
+        self.processed_cpu += cpu_time() - cpu_start
+        self.processed += 1
+
+    def mean_frame_cpu(self):
+        return self.processed_cpu / self.processed if self.processed else 0.0
+
+    '''
+    Print the CPU time saved since the last report, by skipped frames and by
+    frames the governor kept the camera from capturing at all.
+    '''
+    def maybe_report(self, governor=None):
+        if self.next_report is None or time.time() < self.next_report:
+            return
+        self.next_report = time.time() + self.report_interval
+        uncaptured = 0.0
+        if governor is not None:
+            uncaptured = governor.uncaptured - self.report_uncaptured
+            self.report_uncaptured = governor.uncaptured
+        saved = (self.report_skipped + uncaptured) * self.mean_frame_cpu()
+        print("Motion gate: skipped " + str(self.report_skipped) + " frames, " + str(int(uncaptured)) +
+              " not captured, ~" + str(int(saved * 1000)) + " ms CPU saved in the last " +
+              str(int(self.report_interval)) + " seconds")
+        self.report_skipped = 0
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'skipped': self.skipped,
+            'mean_frame_cpu_ms': self.mean_frame_cpu() * 1000.0
+        }
+
+
+class FrameRateGovernor(object):
+
+    def __init__(self, source, active_fps, idle_fps=3, idle_after=5.0):
+        self.source = source
+        self.active_fps = active_fps
+        self.idle_fps = idle_fps
+        # seconds without change or commands before dropping to idle_fps
+        self.idle_after = idle_after
+        self.idle = False
+        self.last_activity = time.time()
+        self.last_update = self.last_activity
+        # frames the camera would have delivered at the active rate but did not
+        self.uncaptured = 0.0
+
+    def update(self, now, moved, commanded):
+        if self.idle:
+            self.uncaptured += (self.active_fps - self.idle_fps) * (now - self.last_update)
+        self.last_update = now
+        if moved or commanded:
+            self.last_activity = now
+            if self.idle:
+                self.idle = False
+                self.source.set_framerate(self.active_fps)
+        elif not self.idle and now - self.last_activity >= self.idle_after:
+            self.idle = True
+            self.source.set_framerate(self.idle_fps)
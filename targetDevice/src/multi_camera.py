@@ -0,0 +1,192 @@
+'''
+Several cameras, each captured and searched by its own process with its own
+detector. Every camera maps its detections into one shared coordinate frame
+with a homography, and CameraFusion merges them into a single laser and
+target position for the command loop. Coverage grows by adding cameras and
+cores rather than resolution.
+
+The cameras are described in a JSON file:
+
+    [
+      {"name": "left", "source": "picamera", "detector": "roi"},
+      {"name": "right", "source": "v4l2", "device": 0,
+       "homography": [[1, 0, 1180], [0, 1, 0], [0, 0, 1]]}
+    ]
+
+A camera's homography maps its pixels into the shared frame; without one
+its pixels are the shared frame's, so the first camera usually goes
+without. "source", "device", "replay" and "realtime" are as for
+open_frame_source, and "detector" is full, roi, pyramid or lut.
+'''
+import json
+import time
+import multiprocessing
+try:
+    from queue import Empty, Full
+except ImportError:
+    from Queue import Empty, Full
+import numpy as np
+from laser_detection import find_laser_and_target, hsv_ranges, RoiDetector, PyramidDetector
+from color_lut import ColorLut, LutDetector
+from frame_sources import open_frame_source
+
+
+def load_cameras(path):
+    with open(path, 'r') as in_file:
+        return json.load(in_file)
+
+
+class FullFrameDetector(object):
+
+    def __init__(self, ranges=None):
+        self.ranges = ranges
+
+    def locate(self, frame, find_target=True):
+        return find_laser_and_target(frame, find_target, self.ranges)
+
+    def forget_target(self):
+        pass
+
+
+def make_detector(mode, thresholds=None, roi_window_px=160, lut_cache_dir='.'):
+    ranges = hsv_ranges(thresholds)
+    if mode == 'roi':
+        return RoiDetector(roi_window_px, ranges=ranges)
+    if mode == 'pyramid':
+        return PyramidDetector(ranges=ranges)
+    if mode == 'lut':
+        return LutDetector(ColorLut(thresholds, lut_cache_dir).load())
+    return FullFrameDetector(ranges)
+
+
+'''
+Map a centroid and radius through a 3x3 homography
+'''
+def to_shared(homography, center, radius):
+    if center is None:
+        return None, 0
+    x, y, w = homography.dot((center[0], center[1], 1.0))
+    scale = np.sqrt(abs(np.linalg.det(homography[:2, :2])))
+    return (int(round(x / w)), int(round(y / w))), float(radius * scale)
+
+
+def _camera_worker(index, camera, resolution, framerate, thresholds, lut_cache_dir, results, stop):
+    detector = make_detector(camera.get('detector', 'full'), thresholds, lut_cache_dir=lut_cache_dir)
+    homography = np.array(camera.get('homography', np.eye(3)), dtype=float)
+    dropped = 0
+    with open_frame_source(camera.get('source', 'picamera'), resolution, framerate, camera.get('device', 0),
+                           camera.get('replay'), realtime=camera.get('realtime', False)) as source:
+        for frame in source.frames():
+            if stop.is_set():
+                break
+            t = time.time()
+            red_center, red_radius, green_center, green_radius = detector.locate(frame)
+            located = to_shared(homography, red_center, red_radius) + to_shared(homography, green_center, green_radius)
+            try:
+                results.put_nowait((index, t, located, dropped))
+            except Full:
+                # the fusion stage is behind, a newer result will follow
+                dropped += 1
+
+
+'''
+Runs one detection process per camera and merges what they see. The latest
+detection from each camera is kept; detections older than max_age seconds
+are ignored, and of the rest those within merge_px of the newest one are
+averaged, so a laser seen by two overlapping cameras gives one position.
+'''
+class CameraFusion(object):
+
+    def __init__(self, cameras, resolution=(1280, 960), framerate=15, thresholds=None, lut_cache_dir='.',
+                 max_age=0.3, merge_px=40, queue_size=8):
+        self.cameras = cameras
+        self.resolution = resolution
+        self.framerate = framerate
+        self.thresholds = thresholds
+        self.lut_cache_dir = lut_cache_dir
+        self.max_age = max_age
+        self.merge_px = merge_px
+        self.results = multiprocessing.Queue(queue_size)
+        self.stop_event = multiprocessing.Event()
+        self.processes = []
+        # camera index -> (time, located in shared coordinates)
+        self.latest = {}
+        self.received = [0] * len(cameras)
+        self.dropped = [0] * len(cameras)
+        self.start_time = None
+
+    def start(self):
+        self.start_time = time.time()
+        for index, camera in enumerate(self.cameras):
+            p = multiprocessing.Process(target=_camera_worker,
+                                        args=(index, camera, self.resolution, self.framerate, self.thresholds,
+                                              self.lut_cache_dir, self.results, self.stop_event))
+            p.daemon = True
+            p.start()
+            self.processes.append(p)
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        # drain so no worker stays blocked on a full pipe
+        try:
+            while True:
+                self.results.get_nowait()
+        except Empty:
+            pass
+        for p in self.processes:
+            p.join(2)
+            if p.is_alive():
+                p.terminate()
+        self.processes = []
+
+    def _merge(self, detections):
+        if not detections:
+            return None, 0
+        newest = max(detections, key=lambda d: d[0])[1]
+        agreeing = [(center, radius) for t, center, radius in detections
+                    if abs(center[0] - newest[0]) <= self.merge_px and abs(center[1] - newest[1]) <= self.merge_px]
+        x = sum(center[0] for center, radius in agreeing) / float(len(agreeing))
+        y = sum(center[1] for center, radius in agreeing) / float(len(agreeing))
+        return (int(round(x)), int(round(y))), max(radius for center, radius in agreeing)
+
+    '''
+    (red_center, red_radius, green_center, green_radius) in shared
+    coordinates, from every camera's latest fresh detection
+    '''
+    def fuse(self, now):
+        lasers = []
+        targets = []
+        for t, located in self.latest.values():
+            if now - t > self.max_age:
+                continue
+            if located[0] is not None:
+                lasers.append((t, located[0], located[1]))
+            if located[2] is not None:
+                targets.append((t, located[2], located[3]))
+        return self._merge(lasers) + self._merge(targets)
+
+    '''
+    Generate the fused detection each time a camera reports, until every
+    camera process has finished
+    '''
+    def updates(self):
+        while True:
+            try:
+                index, t, located, dropped = self.results.get(timeout=1.0)
+            except Empty:
+                if not any(p.is_alive() for p in self.processes):
+                    return
+                continue
+            self.latest[index] = (t, located)
+            self.received[index] += 1
+            self.dropped[index] = dropped
+            yield t, self.fuse(t)
+
+    def stats(self):
+        elapsed = max(time.time() - self.start_time, 1e-6) if self.start_time else 1.0
+        return dict((camera.get('name', str(index)), {
+            'received': self.received[index],
+            'dropped': self.dropped[index],
+            'fps': self.received[index] / elapsed
+        }) for index, camera in enumerate(self.cameras))
@@ -0,0 +1,122 @@
+'''
+Several pan/tilt heads in front of one camera. Each head steers its own
+laser toward its own target LEDs, and is moved through its own IoT thing.
+
+MultiLaserDetector builds the red and green masks once per frame and hands
+each head one laser and one target blob, following every head's blobs from
+frame to frame by position. Targets are matched to where the LED map says
+each head's lit LED is, when it has an entry for it.
+'''
+import numpy as np
+from laser_detection import find_all_blobs, blob_center
+
+
+'''
+One pan/tilt head and the state the command loop keeps for it
+'''
+class Head(object):
+
+    def __init__(self, name='default', thing='lg_thing_0', pins=(4, 18, 23, 24)):
+        self.name = name
+        # IoT thing the fulfilment Lambda moves for this head's commands
+        self.thing = thing
+        # GPIO pins of this head's target LEDs
+        self.pins = list(pins)
+        # each head gets its own Lex session
+        self.user_id = 'targeting' + name.capitalize()
+        self.lit_gpio_pin = None
+        self.next_command_time = 0
+        self.prev_loc_diff = [0,0]
+        self.last_difference = None
+        self.reported_unmoved = False
+        # (trace ID, location difference) of the last traced command whose
+        # effect the camera has not seen yet
+        self.awaiting_motion = None
+        self.history = None
+
+    '''
+    Parse a --head option, NAME:THING:PIN,PIN,...
+    '''
+    @staticmethod
+    def parse(spec):
+        parts = spec.split(':')
+        if len(parts) != 3:
+            raise ValueError("Expected NAME:THING:PIN,PIN,... but got " + spec)
+        name, thing, pins = parts
+        return Head(name, thing, [int(pin) for pin in pins.split(',')])
+
+
+class MultiLaserDetector(object):
+
+    def __init__(self, count, ranges=None, min_area=10, max_jump_px=200):
+        self.ranges = ranges
+        # blobs smaller than this are specks, not lasers or LEDs
+        self.min_area = min_area
+        # furthest a blob may move between frames and still be the same one
+        self.max_jump_px = max_jump_px
+        self.lasers = [None] * count
+        self.targets = [None] * count
+        # int32 image reused for labelling the masks, sized on the first frame
+        self.labels = None
+
+    '''
+    Give each of `previous` (the last centroid per head, or None) one of the
+    blobs. Blobs are first matched to the nearest previous centroid, closest
+    pairs first, or to the head's entry in `expected` instead when it has
+    one. Heads left over without an expected position take the largest
+    remaining blobs, in left to right order, so the heads should be listed in
+    the order their lasers start out across the view. Returns (center,
+    radius) per head.
+    '''
+    def _assign(self, previous, blobs, expected=None):
+        if expected is None:
+            expected = [None] * len(previous)
+        found = [(None, 0)] * len(previous)
+        used = set()
+        pairs = []
+        for head, center in enumerate(previous):
+            if expected[head] is not None:
+                center = expected[head]
+            if center is None:
+                continue
+            for i in range(len(blobs)):
+                distance = ((blobs['cx'][i] - center[0]) ** 2 + (blobs['cy'][i] - center[1]) ** 2) ** 0.5
+                if distance <= self.max_jump_px:
+                    pairs.append((distance, head, i))
+        for distance, head, i in sorted(pairs):
+            if found[head][0] is None and i not in used:
+                found[head] = blob_center(blobs[i])
+                used.add(i)
+        # a head that knows where its blob should be is better off with none
+        # than with another head's
+        unmatched = [head for head in range(len(previous)) if found[head][0] is None and expected[head] is None]
+        # blobs are sorted largest first
+        spare = [i for i in range(len(blobs)) if i not in used][:len(unmatched)]
+        spare.sort(key=lambda i: blobs['cx'][i])
+        for head, i in zip(unmatched, spare):
+            found[head] = blob_center(blobs[i])
+        for head in range(len(previous)):
+            previous[head] = found[head][0]
+        return found
+
+    '''
+    Returns (red_center, red_radius, green_center, green_radius) per head,
+    from one blur, one HSV conversion and one mask per colour.
+    `target_positions` holds where each head's lit LED is expected, e.g.
+    from the LED map, or None for heads whose LED isn't mapped.
+    '''
+    def locate(self, frame, find_target=True, target_positions=None):
+        if self.labels is None or self.labels.shape != frame.shape[:2]:
+            self.labels = np.empty(frame.shape[:2], dtype=np.int32)
+        red_blobs, green_blobs = find_all_blobs(frame, self.min_area, self.ranges, self.labels)
+        lasers = self._assign(self.lasers, red_blobs)
+        targets = [(None, 0)] * len(self.targets)
+        if find_target:
+            targets = self._assign(self.targets, green_blobs, target_positions)
+        return [laser + target for laser, target in zip(lasers, targets)]
+
+    '''
+    A head lit a new LED somewhere else in the frame
+    '''
+    def forget_target(self, index):
+        self.targets[index] = None
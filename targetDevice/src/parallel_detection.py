@@ -0,0 +1,169 @@
+'''
+Spreads laser/LED detection over several worker processes. Frames are copied
+once into a ring of slots in shared memory and only the slot index travels
+through the task queue, so whole frames are never pickled. Results come back
+to the caller in frame order.
+'''
+import multiprocessing
+try:
+    from queue import Empty
+except ImportError:
+    from Queue import Empty
+import numpy as np
+import cv2
+from laser_detection import preprocess, color_mask, largest_blob, find_laser_and_target, hsv_ranges
+
+# 'round-robin' sends whole frames to each worker in turn, 'split' runs the
+# red and green detection for a frame on separate workers
+ROUND_ROBIN = 'round-robin'
+SPLIT = 'split'
+
+
+'''
+Ring of frame-sized slots backed by a single shared memory block
+'''
+class SharedFrameRing(object):
+
+    def __init__(self, shape, slots):
+        self.shape = tuple(shape)
+        self.slots = slots
+        frame_bytes = int(np.prod(self.shape))
+        self.raw = multiprocessing.RawArray('B', frame_bytes * slots)
+        self.views = None
+
+    def attach(self):
+        # the numpy view has to be built in each process that uses the ring
+        if self.views is None:
+            self.views = np.frombuffer(self.raw, dtype=np.uint8).reshape((self.slots,) + self.shape)
+        return self.views
+
+    def __getitem__(self, slot):
+        return self.attach()[slot]
+
+    def __getstate__(self):
+        # only the shared block travels to worker processes, never the view
+        state = self.__dict__.copy()
+        state['views'] = None
+        return state
+
+
+def _detect_worker(ring, tasks, results, ranges):
+    # each worker already gets its own core, so keep OpenCV single threaded
+    cv2.setNumThreads(1)
+    lower_red, upper_red, lower_green, upper_green = ranges
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        seq, slot, part, find_target = task
+        frame = ring[slot]
+        if part == 'both':
+            located = find_laser_and_target(frame, find_target, ranges)
+        elif part == 'red':
+            center, radius = largest_blob(color_mask(preprocess(frame), lower_red, upper_red))
+            located = (center, radius, None, 0)
+        else:
+            center, radius = largest_blob(color_mask(preprocess(frame), lower_green, upper_green))
+            located = (None, 0, center, radius)
+        results.put((seq, part, located))
+
+
+class ParallelDetector(object):
+
+    def __init__(self, shape, workers=3, slots=None, mode=ROUND_ROBIN, ranges=None):
+        self.mode = mode
+        self.ranges = ranges if ranges is not None else hsv_ranges()
+        self.workers = workers
+        # enough slots for every worker to be busy plus one being handed back
+        self.ring = SharedFrameRing(shape, slots if slots is not None else workers + 2)
+        self.tasks = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.processes = []
+        self.free_slots = list(range(self.ring.slots))
+        self.next_seq = 0
+        self.next_ready = 0
+        # seq -> [slot, outstanding parts, located]
+        self.pending = {}
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+
+    def start(self):
+        self.ring.attach()
+        for i in range(self.workers):
+            p = multiprocessing.Process(target=_detect_worker, args=(self.ring, self.tasks, self.results, self.ranges))
+            p.daemon = True
+            p.start()
+            self.processes.append(p)
+        return self
+
+    def stop(self):
+        for p in self.processes:
+            self.tasks.put(None)
+        for p in self.processes:
+            p.join(2)
+        self.processes = []
+
+    '''
+    Copy a frame into a free slot and queue its detection. Returns the frame's
+    sequence number, or None if every slot is still waiting to be released, in
+    which case the frame is dropped.
+    '''
+    def submit(self, frame, find_target=True):
+        if not self.free_slots:
+            self.dropped += 1
+            return None
+        slot = self.free_slots.pop(0)
+        np.copyto(self.ring[slot], frame)
+        seq = self.next_seq
+        self.next_seq += 1
+        if self.mode == SPLIT and find_target:
+            self.pending[seq] = [slot, 2, [None, 0, None, 0]]
+            self.tasks.put((seq, slot, 'red', find_target))
+            self.tasks.put((seq, slot, 'green', find_target))
+        else:
+            self.pending[seq] = [slot, 1, [None, 0, None, 0]]
+            self.tasks.put((seq, slot, 'both', find_target))
+        self.submitted += 1
+        return seq
+
+    def _collect(self, block=False):
+        try:
+            seq, part, located = self.results.get(block)
+        except Empty:
+            return False
+        entry = self.pending[seq]
+        entry[1] -= 1
+        if part in ('both', 'red'):
+            entry[2][0:2] = located[0:2]
+        if part in ('both', 'green'):
+            entry[2][2:4] = located[2:4]
+        return True
+
+    '''
+    Yield (seq, frame, located) for every finished frame, in frame order.
+    The frame is a view into shared memory that stays valid until release().
+    '''
+    def ready(self):
+        while self._collect():
+            pass
+        while self.next_ready in self.pending and self.pending[self.next_ready][1] == 0:
+            seq = self.next_ready
+            self.next_ready += 1
+            slot, outstanding, located = self.pending[seq]
+            yield seq, self.ring[slot], tuple(located)
+
+    def release(self, seq):
+        slot = self.pending.pop(seq)[0]
+        self.free_slots.append(slot)
+        self.completed += 1
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'mode': self.mode,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'dropped': self.dropped,
+            'in_flight': len(self.pending)
+        }
@@ -1,11 +1,10 @@
 #! /usr/bin/env python
 import argparse
-import os, boto3, io, sys, time, json
+import os, boto3, sys, time, json
 from contextlib import closing
 import cv2
 import numpy as np
-from picamera.array import PiRGBArray
-from picamera import PiCamera
+from frame_sources import open_frame_source
 
 '''
 Uses a camera to track a laser pointer and instruct it, via dictation,
@@ -13,7 +12,11 @@ to move toward a destination.
 '''
 class LaserTracker(object):
 
-    def __init__(self):
+    def __init__(self, source='picamera', device=0, replay_path=None):
+        # Where frames come from: 'picamera', 'v4l2' or 'replay'
+        self.source = source
+        self.device = device
+        self.replay_path = replay_path
         # How often we'll dictate commands
         self.command_interval = 2 #seconds
         self.hit_radius_px = 50 # pixels
@@ -97,31 +100,28 @@ class LaserTracker(object):
     def run(self):
         #initialize rekognition connection
         rekognition = self.connectToRekognition()
-        # initialize the camera and grab a reference to the raw camera capture
-        # with-block ensures camera.close() is called upon exit.
-        with PiCamera(resolution = (640, 480),framerate = 35) as camera:
+        # initialize the frame source
+        # with-block ensures it is closed upon exit.
+        with open_frame_source(self.source, (640, 480), 35, self.device, self.replay_path, realtime=True) as source:
+            camera = getattr(source, 'camera', None)
             try:
-                camera.hflip = True
-                camera.vflip = True
-                # allow the camera to warmup
-                time.sleep(0.1)
-                camera.start_preview()
+                if camera is not None:
+                    camera.hflip = True
+                    camera.vflip = True
+                    camera.start_preview()
                 
                 # initialize the next time to dictate a command to now
                 next_command_time = time.time()
                 prev_loc_diff = [0,0]
-                byteStream = io.BytesIO()
                 prev_time = time.time()
                 stop_time = time.time() + (60 * 5)
-                # capture frames from the camera
-                for frame in camera.capture_continuous(byteStream, format='jpeg'):
-                    byteStream.truncate()
-                    byteStream.seek(0)
-                    
+                # capture frames from the source
+                for frame in source.frames():
                     now = time.time()
                     
                     if (now > prev_time + 3):
-                        rekognition_resp = rekognition.detect_labels(Image={'Bytes': byteStream.getvalue()})
+                        jpeg = cv2.imencode('.jpg', frame)[1].tobytes()
+                        rekognition_resp = rekognition.detect_labels(Image={'Bytes': jpeg})
                         print(rekognition_resp)
                         prev_time = now
                     
@@ -129,11 +129,22 @@ class LaserTracker(object):
                         break
              
             finally:
-                camera.stop_preview()
+                if camera is not None:
+                    camera.stop_preview()
                 
 
 
 if __name__ == '__main__':
-    tracker = LaserTracker()
+    parser = argparse.ArgumentParser(description='Send camera frames to Rekognition every few seconds.')
+    parser.add_argument('--source', dest='source', default='picamera',
+                        choices=['picamera', 'v4l2', 'replay'],
+                        help='Where frames come from.')
+    parser.add_argument('--device', dest='device', type=int, default=0,
+                        help='cv2.VideoCapture device index for the v4l2 source.')
+    parser.add_argument('--replay', dest='replay_path',
+                        help='Recorded session to replay with the replay source.')
+    args = parser.parse_args()
+
+    tracker = LaserTracker(source=args.source, device=args.device, replay_path=args.replay_path)
     tracker.run()
 
@@ -0,0 +1,93 @@
+#! /usr/bin/env python
+'''
+Replays a session recorded with `track_laser.py --record` through
+LaserTracker's detection at full speed and reports frames per second, plus
+how far the chosen detector's centroids are from a reference detector's.
+Runs on any Linux box, no camera or GPIO needed.
+
+    python replay_detect.py session.npz --detector roi --reference full
+'''
+import argparse
+import json
+import time
+import numpy as np
+from frame_sources import ReplaySource
+from track_laser import LaserTracker
+
+
+def centroid_error(a, b):
+    if a is None or b is None:
+        return None
+    return float(np.hypot(a[0] - b[0], a[1] - b[1]))
+
+
+def summarize(errors):
+    if not errors:
+        return None
+    return {
+        'mean_px': float(np.mean(errors)),
+        'p95_px': float(np.percentile(errors, 95)),
+        'max_px': float(np.max(errors))
+    }
+
+
+def replay(path, detector_mode='full', reference_mode='full', kalman=False):
+    tracker = LaserTracker(detector_mode=detector_mode, headless=True, kalman=kalman, source='replay')
+    reference = LaserTracker(detector_mode=reference_mode, headless=True, source='replay')
+    # no commands are dictated during a replay, so the Kalman filters may skip
+    tracker.heads[0].next_command_time = float('inf')
+    detect_time = 0.0
+    frames = 0
+    laser_errors = []
+    target_errors = []
+    # frames where only one of the two detectors found the laser/target
+    laser_mismatches = 0
+    target_mismatches = 0
+
+    with ReplaySource(path) as source:
+        for frame in source.frames():
+            start = time.time()
+            located = tracker.track(frame)
+            detect_time += time.time() - start
+            frames += 1
+
+            expected = reference.locate(frame)
+            for index, errors in ((0, laser_errors), (2, target_errors)):
+                if (located[index] is None) != (expected[index] is None):
+                    if index == 0:
+                        laser_mismatches += 1
+                    else:
+                        target_mismatches += 1
+                error = centroid_error(located[index], expected[index])
+                if error is not None:
+                    errors.append(error)
+
+    return {
+        'recording': path,
+        'detector': detector_mode,
+        'reference': reference_mode,
+        'kalman': kalman,
+        'frames': frames,
+        'fps': frames / detect_time if detect_time > 0 else None,
+        'laser_error': summarize(laser_errors),
+        'target_error': summarize(target_errors),
+        'laser_mismatches': laser_mismatches,
+        'target_mismatches': target_mismatches
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a recorded session through the laser/LED detector.')
+    parser.add_argument('recording', help='.npz file written by track_laser.py --record')
+    parser.add_argument('--detector', dest='detector_mode', default='full',
+                        choices=['full', 'roi', 'pyramid', 'lut'],
+                        help='Detector to measure.')
+    parser.add_argument('--reference', dest='reference_mode', default='full',
+                        choices=['full', 'roi', 'pyramid', 'lut'],
+                        help='Detector whose centroids count as correct.')
+    parser.add_argument('--kalman', dest='kalman', action='store_true',
+                        help='Track through the Kalman filters, skipping frames where allowed.')
+    args = parser.parse_args()
+
+    print(json.dumps(replay(args.recording, args.detector_mode, args.reference_mode, args.kalman),
+                     indent=2, sort_keys=True))
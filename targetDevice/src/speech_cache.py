@@ -0,0 +1,200 @@
+'''
+Polly audio cache. Clips are keyed by everything that changes the audio,
+(text, voice, format, sample rate), stored in one directory under the hash of
+that key, and listed in a JSON manifest next to them. The directory is kept
+under max_bytes by evicting the least recently used clips, and the hottest
+clips are also kept in memory so a repeated command never touches the disk.
+
+Every command phrase the tracker can dictate is known up front, so prewarm()
+fetches the missing ones from Polly in parallel at startup and no command
+pays for a Polly round trip the first time it is used.
+'''
+import os
+import json
+import time
+import hashlib
+import threading
+import traceback
+from collections import OrderedDict
+from contextlib import closing
+from multiprocessing.pool import ThreadPool
+
+EXTENSIONS = {'ogg_vorbis': '.ogg', 'pcm': '.pcm', 'mp3': '.mp3'}
+MANIFEST = 'manifest.json'
+
+
+def clip_key(text, voice, format, sample_rate=None):
+    key = json.dumps([text, voice, format, sample_rate])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+class SpeechCache(object):
+
+    def __init__(self, cache_dir='speech_cache', max_bytes=50 * 1024 * 1024, hot_clips=16):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hot_clips = hot_clips
+        self.lock = threading.Lock()
+        # key -> {'text', 'voice', 'format', 'sample_rate', 'file', 'bytes', 'last_used'}
+        self.entries = {}
+        # key -> audio bytes, least recently used first
+        self.hot = OrderedDict()
+        # key -> Event set when the Polly request for it is done, so clips
+        # wanted by several threads at once are only synthesized once
+        self.fetching = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._load_manifest()
+
+    def _manifest_path(self):
+        return os.path.join(self.cache_dir, MANIFEST)
+
+    def _load_manifest(self):
+        path = self._manifest_path()
+        if not os.path.isfile(path):
+            return
+        with open(path, 'r') as in_file:
+            entries = json.load(in_file)
+        # drop entries whose clip was deleted behind our back
+        self.entries = dict((key, entry) for key, entry in entries.items()
+                            if os.path.isfile(os.path.join(self.cache_dir, entry['file'])))
+
+    def _save_manifest(self):
+        path = self._manifest_path()
+        with open(path + '.tmp', 'w') as out_file:
+            json.dump(self.entries, out_file, indent=2, separators=(',', ': '), sort_keys=True)
+        os.rename(path + '.tmp', path)
+
+    '''
+    Remove the least recently used clips until the cache fits max_bytes,
+    always keeping the clip just fetched
+    '''
+    def _evict(self, keep):
+        total = sum(entry['bytes'] for entry in self.entries.values())
+        for key, entry in sorted(self.entries.items(), key=lambda item: item[1]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            try:
+                os.remove(os.path.join(self.cache_dir, entry['file']))
+            except OSError:
+                pass
+            total -= entry['bytes']
+            del self.entries[key]
+            self.hot.pop(key, None)
+            self.evicted += 1
+
+    def _remember(self, key, audio):
+        self.hot.pop(key, None)
+        self.hot[key] = audio
+        while len(self.hot) > self.hot_clips:
+            self.hot.popitem(last=False)
+
+    def _synthesize(self, polly, text, voice, format, sample_rate):
+        kwargs = {'OutputFormat': format, 'Text': text, 'VoiceId': voice}
+        if sample_rate is not None:
+            kwargs['SampleRate'] = str(sample_rate)
+        resp = polly.synthesize_speech(**kwargs)
+        with closing(resp["AudioStream"]) as stream:
+            return stream.read()
+
+    '''
+    Audio bytes of a cached clip, or None. Call with the lock held.
+    '''
+    def _cached(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        entry['last_used'] = time.time()
+        if key in self.hot:
+            self.hits += 1
+            audio = self.hot[key]
+        else:
+            with open(os.path.join(self.cache_dir, entry['file']), 'rb') as in_file:
+                audio = in_file.read()
+            self.disk_hits += 1
+        self._remember(key, audio)
+        return audio
+
+    '''
+    Audio bytes of the clip, from memory, disk or Polly in that order
+    '''
+    def get(self, polly, text, voice='Joanna', format='ogg_vorbis', sample_rate=None):
+        key = clip_key(text, voice, format, sample_rate)
+        while True:
+            with self.lock:
+                audio = self._cached(key)
+                if audio is not None:
+                    return audio
+                fetching = self.fetching.get(key)
+                if fetching is None:
+                    fetching = self.fetching[key] = threading.Event()
+                    break
+            # another thread is already asking Polly for it
+            fetching.wait()
+        try:
+            print("No cached " + format + " audio for: " + text + ". Calling Polly...")
+            audio = self._synthesize(polly, text, voice, format, sample_rate)
+            filename = key + EXTENSIONS.get(format, '.' + format)
+            with self.lock:
+                if not os.path.isdir(self.cache_dir):
+                    os.makedirs(self.cache_dir)
+                with open(os.path.join(self.cache_dir, filename), 'wb') as out_file:
+                    out_file.write(audio)
+                self.entries[key] = {'text': text, 'voice': voice, 'format': format, 'sample_rate': sample_rate,
+                                     'file': filename, 'bytes': len(audio), 'last_used': time.time()}
+                self.misses += 1
+                self._remember(key, audio)
+                self._evict(key)
+                self._save_manifest()
+        finally:
+            with self.lock:
+                del self.fetching[key]
+            fetching.set()
+        return audio
+
+    '''
+    Fetch every (text, voice, format, sample_rate) clip that isn't cached yet,
+    `workers` Polly requests at a time. Returns how many were fetched.
+    '''
+    def prewarm(self, polly, clips, workers=4):
+        missing = [clip for clip in clips if clip_key(*clip) not in self.entries]
+        if not missing:
+            return 0
+
+        def fetch(clip):
+            try:
+                self.get(polly, *clip)
+                return True
+            except Exception:
+                print("Could not prewarm " + str(clip) + ": " + traceback.format_exc())
+                return False
+
+        pool = ThreadPool(min(workers, len(missing)))
+        try:
+            fetched = pool.map(fetch, missing)
+        finally:
+            pool.close()
+            pool.join()
+        return sum(fetched)
+
+    '''
+    Write the recency of the clips used since the last fetch
+    '''
+    def close(self):
+        with self.lock:
+            if self.entries:
+                self._save_manifest()
+
+    def stats(self):
+        return {
+            'clips': len(self.entries),
+            'bytes': sum(entry['bytes'] for entry in self.entries.values()),
+            'memory_hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evicted': self.evicted
+        }
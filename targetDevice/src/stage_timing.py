@@ -0,0 +1,141 @@
+'''
+Low-overhead per-stage timing for the tracking loop. Durations go into fixed
+size, log-spaced histograms, so memory use stays constant however long the
+tracker runs.
+
+Instrumented code always goes through the module level `timer`:
+
+    t = stage_timing.timer.mark()
+    ...
+    t = stage_timing.timer.record('blur', t)
+
+By default `timer` is a NullTimer whose methods do nothing, so leaving timing
+off costs one attribute lookup and an empty call per stage.
+'''
+import bisect
+import json
+import time
+
+# histogram bucket upper edges in milliseconds, 10 buckets per decade from
+# 0.01 ms to 10 s, plus an overflow bucket
+BUCKET_EDGES_MS = [10 ** (e / 10.0) for e in range(-20, 41)]
+
+# the order stages are reported in
+STAGES = ['capture_wait', 'blur', 'convert', 'threshold', 'morphology', 'contours',
+          'decision', 'dispatch']
+
+
+class NullTimer(object):
+
+    enabled = False
+
+    def mark(self):
+        return 0
+
+    def record(self, stage, start):
+        return 0
+
+    def maybe_dump(self):
+        pass
+
+    def dump(self):
+        pass
+
+
+class StageHistogram(object):
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_EDGES_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(BUCKET_EDGES_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    '''
+    Upper edge of the bucket holding the given percentile, in milliseconds
+    '''
+    def percentile(self, pct):
+        if self.count == 0:
+            return None
+        target = self.count * pct / 100.0
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(BUCKET_EDGES_MS[i], self.max_ms) if i < len(BUCKET_EDGES_MS) else self.max_ms
+        return self.max_ms
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.total_ms / self.count if self.count else None,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'max_ms': self.max_ms
+        }
+
+
+class StageTimer(object):
+
+    enabled = True
+
+    def __init__(self, dump_interval=60.0, output_path=None):
+        self.histograms = {}
+        # seconds between periodic dumps, None to only dump on exit
+        self.dump_interval = dump_interval
+        self.output_path = output_path
+        self.next_dump = time.time() + dump_interval if dump_interval else None
+
+    def mark(self):
+        return time.time()
+
+    '''
+    Add the time since `start` to a stage and return the current time, so it
+    can be used as the start of the next stage.
+    '''
+    def record(self, stage, start):
+        now = time.time()
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = StageHistogram()
+        histogram.add((now - start) * 1000.0)
+        return now
+
+    def summary(self):
+        ordered = [s for s in STAGES if s in self.histograms] + \
+                  sorted(s for s in self.histograms if s not in STAGES)
+        return [(stage, self.histograms[stage].summary()) for stage in ordered]
+
+    def maybe_dump(self):
+        if self.next_dump is not None and time.time() >= self.next_dump:
+            self.next_dump = time.time() + self.dump_interval
+            self.dump()
+
+    def dump(self):
+        summary = self.summary()
+        print("%-13s %8s %9s %9s %9s %9s" % ('stage', 'count', 'mean ms', 'p50 ms', 'p95 ms', 'max ms'))
+        for stage, s in summary:
+            print("%-13s %8d %9.2f %9.2f %9.2f %9.2f" % (
+                stage, s['count'], s['mean_ms'], s['p50_ms'], s['p95_ms'], s['max_ms']))
+        if self.output_path is not None:
+            with open(self.output_path, 'w') as out_file:
+                json.dump(dict(summary), out_file, indent=2, sort_keys=True)
+
+
+timer = NullTimer()
+
+
+'''
+Switch timing on for every instrumented module and return the timer
+'''
+def enable(dump_interval=60.0, output_path=None):
+    global timer
+    timer = StageTimer(dump_interval, output_path)
+    return timer
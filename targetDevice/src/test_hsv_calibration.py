@@ -0,0 +1,57 @@
+'''
+Fits HSV ranges to synthetic laser samples whose hues sit around OpenCV's
+0/180 red wrap.
+'''
+import cv2
+import numpy as np
+from hsv_calibration import Sample, fit_range
+
+
+'''
+A dim grey frame with a laser-like patch whose hues are drawn from `hues`,
+and the Sample of it. The hue changes in 10 pixel tiles so the blur keeps
+the drawn hues.
+'''
+def red_sample(hues, seed=0):
+    rng = np.random.RandomState(seed)
+    hsv = np.zeros((160, 200, 3), dtype=np.uint8)
+    hsv[:, :, 2] = 60
+    mask = np.zeros((160, 200), dtype=np.uint8)
+    mask[40:120, 60:140] = 255
+    patch = hsv[40:120, 60:140]
+    tiles = np.ones((10, 10), dtype=np.uint8)
+    patch[:, :, 0] = np.kron(rng.choice(hues, size=(8, 8)), tiles)
+    patch[:, :, 1] = np.kron(rng.randint(180, 220, size=(8, 8)), tiles)
+    patch[:, :, 2] = np.kron(rng.randint(200, 240, size=(8, 8)), tiles)
+    # erode so the blurred edge of the patch isn't sampled
+    return Sample(cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR), cv2.erode(mask, None, iterations=8))
+
+
+def test_red_hues_above_zero():
+    fitted = fit_range([red_sample(np.arange(0, 7))], wrap_hue=True)
+    assert fitted is not None
+    assert fitted['lower'][0] == 0
+    assert 6 <= fitted['upper'][0] < 20
+    assert fitted['lower'][0] <= fitted['upper'][0]
+    assert fitted['coverage'] >= 0.9
+
+
+def test_red_hues_straddling_zero_keep_the_larger_side():
+    hues = np.concatenate([np.arange(0, 5)] * 3 + [np.arange(176, 180)])
+    fitted = fit_range([red_sample(hues)], wrap_hue=True)
+    assert fitted is not None
+    assert fitted['lower'][0] == 0
+    assert fitted['upper'][0] < 20
+    assert fitted['coverage'] >= 0.5
+
+
+def test_red_hues_below_180():
+    fitted = fit_range([red_sample(np.arange(172, 180))], wrap_hue=True)
+    assert fitted is not None
+    assert 150 < fitted['lower'][0] <= 172
+    assert fitted['upper'][0] == 179
+    assert fitted['coverage'] >= 0.9
+
+
+def test_no_fit_below_min_coverage():
+    assert fit_range([red_sample(np.arange(0, 7))], wrap_hue=True, min_coverage=1.01) is None
@@ -1,17 +1,46 @@
 #! /usr/bin/env python
 import argparse
 import os, boto3
-from contextlib import closing
 import cv2
 import sys
 import numpy as np
-from picamera.array import PiRGBArray
-from picamera import PiCamera
 import time
 import json
-import RPi.GPIO as gpio
+try:
+    import RPi.GPIO as gpio
+except ImportError:
+    # no GPIO off the Pi, e.g. when replaying recorded frames
+    gpio = None
 import random
 import threading
+import subprocess
+import stage_timing
+from laser_detection import (find_laser_and_target, hsv_ranges, yuv_ranges, load_thresholds, RoiDetector,
+                             PyramidDetector, YuvDetector)
+from led_map import LedMap
+from frame_capture import ThreadedCapture
+from parallel_detection import ParallelDetector
+from debug_stream import DebugStream
+from color_lut import ColorLut, LutDetector
+from kalman_tracker import KalmanTracker
+from frame_sources import open_frame_source, FrameRecorder
+from latency_trace import LatencyTracer, new_trace_id
+from motion_gate import MotionGate, FrameRateGovernor, cpu_time
+from centroid_history import CentroidHistory
+from black_box import BlackBoxRecorder
+from hsv_calibration import profile_path
+from multi_laser import Head, MultiLaserDetector
+from multi_camera import CameraFusion, load_cameras
+from command_dispatcher import CommandDispatcher
+from speech_cache import SpeechCache
+from audio_player import AudioPlayer
+from direct_intent import ShadowMover, parse_command
+
+# every command decide() can dictate
+COMMANDS = ['move left', 'move right', 'move up', 'move down']
+# Polly synthesizes each command once, as 16-bit mono PCM at this rate, and
+# the same clip is posted to Lex and played on the speaker
+SAMPLE_RATE = 16000
 
 '''
 Uses a camera to track a laser pointer and instruct it, via dictation,
@@ -19,21 +48,150 @@ to move toward a destination.
 '''
 class LaserTracker(object):
 
-    def __init__(self):
-        self.gpio_pins = [4, 18, 23, 24]
+    def __init__(self, detector_mode='full', roi_window_px=160, led_map_path=None, calibrate_leds=False,
+                 threaded_capture=False, capture_pool_size=3, parallel_workers=0, parallel_mode='round-robin',
+                 headless=False, debug_port=None, debug_fps=2.0, thresholds_path=None, lut_cache_dir='.',
+                 kalman=False, max_skip=2, source='picamera', device=0, replay_path=None, record_path=None,
+                 trace_log=None, motion_gate=False, idle_fps=3, idle_after=5.0,
+                 smoothing='median', smoothing_window=5, black_box_dir=None, black_box_seconds=10.0,
+                 heads=None, cameras=None, speech_cache_dir='speech_cache', speech_cache_mb=50,
+                 command_path='audio', speak=True, step_amount=10):
+        # One pan/tilt head steering one laser by default, or several in front
+        # of the same camera, each with its own target LEDs
+        self.heads = heads if heads else [Head()]
+        self.gpio_pins = sorted(set(pin for head in self.heads for pin in head.pins))
+        self.resolution = (1280, 960)
+        self.framerate = 15
+        # Where frames come from: 'picamera', 'v4l2' (cv2.VideoCapture) or
+        # 'replay' of a recorded session, optionally recording what is seen
+        self.source = source
+        self.device = device
+        self.replay_path = replay_path
+        self.record_path = record_path
+        # Capture on a background thread into preallocated buffers
+        self.threaded_capture = threaded_capture
+        self.capture_pool_size = capture_pool_size
+        self.capture = None
         # How often we'll dictate commands
         self.command_interval = 1.5 #seconds
+        # Commands are spoken and sent to Lex on a long-lived thread while the
+        # loop goes on with the next frame, so they can't hold up detection
+        self.dispatcher = None
+        # Polly clips for the speaker and for Lex, fetched ahead of time
+        self.speech_cache = SpeechCache(speech_cache_dir, int(speech_cache_mb * 1024 * 1024))
+        # Keeps the sound card open and plays clips from memory while running
+        self.player = None
+        # How a command reaches the head: 'audio' posts the spoken command to
+        # Lex, 'text' posts its text to Lex and 'shadow' skips Lex and the
+        # Lambda and writes the head's IoT shadow directly. Speaking it aloud
+        # is optional and happens alongside.
+        self.command_path = command_path
+        self.speak_commands = speak
+        self.step_amount = step_amount
+        self.mover = None
+        self.last_located = None
+        # Commands act on the median or moving average of the last few
+        # centroids rather than on a single frame, unless smoothing is 'none'
+        self.smoothing = smoothing
+        if smoothing != 'none':
+            for head in self.heads:
+                head.history = CentroidHistory(window=smoothing_window)
+        # Skip detection on frames where nothing changed, and drop to idle_fps
+        # after idle_after seconds without change or commands
+        self.motion_gate = MotionGate(self.resolution) if motion_gate else None
+        self.idle_fps = idle_fps
+        self.idle_after = idle_after
+        # Follow each command end to end with a correlation ID and hop timestamps
+        self.tracer = LatencyTracer(trace_log) if trace_log is not None else None
+        self.frame_time = None
         self.hit_radius_px = 70 # pixels
         self.defaultRegion = 'us-east-1'
         self.defaultPollyEndpoint = 'https://polly.us-east-1.amazonaws.com'
-        gpio.setmode(gpio.BCM)
-        gpio.setwarnings(False)
-        
-        for pin in self.gpio_pins:
-            gpio.setup(pin, gpio.OUT)
+        # 'full' searches the whole frame every time, 'roi' only searches windows
+        # around the last known laser/LED positions, 'pyramid' searches a
+        # downsampled frame before refining at full resolution, 'yuv'
+        # captures YUV420 and classifies the planes without converting to HSV
+        # and 'lut' classifies both colours with a precomputed lookup table
+        self.detector_mode = detector_mode
+        self.detector = None
+        self.capture_format = 'bgr'
+        # HSV ranges (and YUV bounds for the yuv detector) from a calibrated
+        # profile or range-detector output, the tuned defaults otherwise
+        thresholds = load_thresholds(thresholds_path)
+        self.thresholds = thresholds
+        self.ranges = hsv_ranges(thresholds)
+        self.lut_cache_dir = lut_cache_dir
+        # Optionally detect on several cameras, a process each, and act on
+        # their fused detections instead of on frames from one source
+        self.cameras = cameras
+        if cameras and (len(self.heads) > 1 or led_map_path is not None or parallel_workers > 0 or kalman
+                        or motion_gate or black_box_dir is not None or debug_port is not None):
+            raise ValueError("Several cameras support one head, without an LED map, worker processes, Kalman "
+                             "filters, the motion gate, the black box or the debug stream")
+        if detector_mode == 'roi':
+            self.detector = RoiDetector(roi_window_px, ranges=self.ranges)
+        elif detector_mode == 'pyramid':
+            self.detector = PyramidDetector(ranges=self.ranges)
+        elif detector_mode == 'lut':
+            self.detector = LutDetector(ColorLut(thresholds, lut_cache_dir).load())
+        elif detector_mode == 'yuv':
+            self.detector = YuvDetector(self.resolution, yuv_ranges(thresholds))
+            self.capture_format = 'yuv'
+            if parallel_workers > 0 or led_map_path is not None or source != 'picamera':
+                raise ValueError("The yuv detector needs the Pi camera and does not support worker processes or an LED map")
+            if thresholds_path is not None and 'yuv' not in thresholds:
+                # range-detector output and older profiles only have HSV ranges
+                raise ValueError("The yuv detector needs YUV bounds, recalibrate the profile with hsv_calibration.py")
+        # Several heads share one blur, HSV conversion and mask per colour
+        self.multi_detector = None
+        if len(self.heads) > 1:
+            if detector_mode != 'full' or parallel_workers > 0 or kalman:
+                raise ValueError("Several heads need the full detector, without worker processes or Kalman filters")
+            self.multi_detector = MultiLaserDetector(len(self.heads), self.ranges)
+        # Optionally run detection in worker processes sharing frames through shared memory
+        self.parallel = None
+        if parallel_workers > 0:
+            self.parallel = ParallelDetector((self.resolution[1], self.resolution[0], 3),
+                                             workers=parallel_workers, mode=parallel_mode, ranges=self.ranges)
+        # Keep the last few seconds of downscaled frames and detections, and
+        # write them out on a hit, a lost lock or a Lex retry
+        self.black_box = None
+        if black_box_dir is not None:
+            self.black_box = BlackBoxRecorder(black_box_dir, black_box_seconds, self.framerate, self.resolution,
+                                              grey=self.capture_format == 'yuv')
+        # Smooth the centroids with Kalman filters and skip detection on frames
+        # where the prediction is good enough and no command is due
+        self.kalman = KalmanTracker(max_skip=max_skip) if kalman else None
+        # Headless units skip all drawing and GUI calls, and can serve a
+        # low-rate MJPEG stream of annotated frames instead
+        self.headless = headless
+        self.debug_stream = None
+        if debug_port is not None:
+            self.debug_stream = DebugStream(debug_port, debug_fps, draw=self.draw,
+                                            to_bgr=self.detector.to_bgr if self.capture_format == 'yuv' else None)
+        # The target LEDs never move, so optionally look up the lit one in a
+        # persisted map instead of searching for green on every frame
+        self.led_map = None
+        self.calibrate_leds = calibrate_leds
+        if led_map_path is not None:
+            self.led_map = LedMap(led_map_path, ranges=self.ranges)
+            self.led_map.load()
+        if gpio is not None:
+            gpio.setmode(gpio.BCM)
+            gpio.setwarnings(False)
+            
+            for pin in self.gpio_pins:
+                gpio.setup(pin, gpio.OUT)
         
         return
 
+    '''
+    Switch a target LED on or off. Does nothing without GPIO.
+    '''
+    def set_led(self, pin, on):
+        if gpio is not None:
+            gpio.output(pin, gpio.HIGH if on else gpio.LOW)
+
     '''
     Create a boto3 AWS Polly client
     '''
@@ -43,6 +201,14 @@ class LaserTracker(object):
         print("Connecting to Polly in " + regionName + " at URL " + endpointUrl)
         return boto3.client('polly', region_name=regionName, endpoint_url=endpointUrl)
     
+    '''
+    Create a boto3 AWS IoT data client
+    '''
+    def connectToIot(self, regionName=None):
+        regionName = regionName if regionName is not None else self.defaultRegion
+        print("Connecting to IoT in " + regionName)
+        return boto3.client('iot-data', region_name=regionName)
+
     '''
     Create a boto3 AWS Lex client
     '''
@@ -53,34 +219,29 @@ class LaserTracker(object):
 
     '''
     Use a given AWS Polly boto3 client to dictate a string of text.
-    Can optionally specify the file format for the audio and the dictation voice
+    Can optionally specify the dictation voice. The raw PCM is written
+    straight to the sound card, so there is nothing to decode. While running,
+    the clip is handed to the audio player and cuts off the previous command
+    if that is still being spoken.
     '''
-    def speak(self, polly, text, format='ogg_vorbis', voice='Joanna'):
+    def speak(self, polly, text, voice='Joanna'):
         now = time.time()
-        #filename = 'tmp.ogg'
-        filename = text.replace(' ', '_') + '.ogg'
-        # look for cached result
-        if os.path.isfile(filename):
-            print("Previous audio file found. Playing: " + filename)
-            os.system('omxplayer ' + filename)
-        else:
-            # No cached result, so fetch from Polly
-            print("No previous result for audio filename: " + filename + ". Calling Polly...")
-            resp = polly.synthesize_speech(OutputFormat=format, Text=text, VoiceId=voice)
-            with closing(resp["AudioStream"]) as stream:
-                # mp3 files were playing the with end clipped via omxplayer.
-                soundfile = open(filename, 'wb')
-                soundfile.write(stream.read())
-                soundfile.flush()
-                soundfile.close()
-                os.system('omxplayer ' + filename + ' > /dev/null')
+        audio = self.speech_cache.get(polly, text, voice, 'pcm', SAMPLE_RATE)
+        if self.player is not None:
+            self.player.play(audio)
+            print("Started audio in " + str(time.time() - now) + " seconds")
+            return
+        player = subprocess.Popen(['aplay', '-q', '-t', 'raw', '-f', 'S16_LE', '-c', '1', '-r', str(SAMPLE_RATE)],
+                                  stdin=subprocess.PIPE)
+        player.communicate(audio)
 
         print("Spoke audio in " + str(time.time() - now) + " seconds")
 
     '''
     '''
     def send_to_lex(self, polly_client, lex_client, text='Hello world', botName='testing', botAlias='test_alias', userId='targetingDefault', voice='Joanna', \
-                          lexContentType='audio/x-l16; sample-rate=16000; channel-count=1'):
+                          lexContentType='audio/x-l16; sample-rate=' + str(SAMPLE_RATE) + '; channel-count=1', thing=None, trace_id=None):
+        lexAttributes = self.lex_attributes(thing, trace_id)
         
         lex_parsed = False
         
@@ -89,29 +250,20 @@ class LaserTracker(object):
             #print("Calling Polly for command " + text)
             
             ####
-            filename = text.replace(' ', '_') + '.pcm'
-            # look for cached result
-            if os.path.isfile(filename):
-                print("Previous PCM audio file found. Sending to Lex: " + filename)
+            audio = self.speech_cache.get(polly_client, text, voice, 'pcm', SAMPLE_RATE)
+            self.trace(trace_id, 'polly_done')
+            
+            self.trace(trace_id, 'lex_sent')
+            lex_resp = lex_client.post_content(botName=botName, botAlias=botAlias, userId=userId, contentType=lexContentType, inputStream=audio,
+                                               requestAttributes=lexAttributes)
+            self.trace(trace_id, 'lex_response', dialog_state=lex_resp.get('dialogState'))
+            print("Fetched audio and posted to Lex in " + str(time.time() - start) + " seconds")
+            
+            if lex_resp['dialogState'] == 'ElicitIntent':
+                print('Lex failed to parse command: ' + text + '. Retrying... \nResponse: ' + str(lex_resp))
+                self.black_box_event('lex_retry')
             else:
-                # No cached result, so fetch from Polly
-                print("No previous result for PCM audio filename: " + filename + ". Calling Polly...")
-                resp = polly_client.synthesize_speech(OutputFormat='pcm', SampleRate='16000', Text=text, VoiceId=voice)
-                with closing(resp["AudioStream"]) as stream:
-                    # mp3 files were playing the with end clipped via omxplayer.
-                    soundfile = open(filename, 'wb')
-                    soundfile.write(stream.read())
-                    soundfile.flush()
-                    soundfile.close()
-                    
-            with closing(open(filename, 'r')) as stream:
-                lex_resp = lex_client.post_content(botName=botName, botAlias=botAlias, userId=userId, contentType=lexContentType, inputStream=stream.read())
-                print("Fetched audio and posted to Lex in " + str(time.time() - start) + " seconds")
-                
-                if lex_resp['dialogState'] == 'ElicitIntent':
-                    print('Lex failed to parse command: ' + text + '. Retrying... \nResponse: ' + lex_resp)
-                else:
-                    lex_parsed = True
+                lex_parsed = True
                     
             ####
             '''
@@ -128,181 +280,642 @@ class LaserTracker(object):
             '''
 
 
-    def detect(self, frame):
-        # Blur to smooth edges of shapes
-        blurred = cv2.GaussianBlur(frame, (11,11), 0)
-        hsv_blurred = cv2.cvtColor(blurred, cv2.COLOR_BGR2HSV)
-        # define the lower and upper boundaries
-        # in the HSV color space
-        lower_red = np.array([166, 31, 122])
-        upper_red = np.array([250, 250, 255])
-        lower_green = np.array([40, 15, 140])
-        upper_green = np.array([100, 255, 255])
-        
-        # construct a mask for the colors, then perform
-        # a series of dilations and erosions to remove any small
-        # blobs left in the mask
-        red_mask = cv2.inRange(hsv_blurred, lower_red, upper_red)
-        red_mask = cv2.erode(red_mask, None, iterations=2)
-        red_mask = cv2.dilate(red_mask, None, iterations=2)
-        green_mask = cv2.inRange(hsv_blurred, lower_green, upper_green)
-        green_mask = cv2.erode(green_mask, None, iterations=2)
-        green_mask = cv2.dilate(green_mask, None, iterations=2)
-
-        # find contours in the mask and initialize the current
-        # (x, y) center of the ball
-        green_cnts = cv2.findContours(green_mask.copy(), cv2.RETR_EXTERNAL,
-            cv2.CHAIN_APPROX_SIMPLE)[-2]
-        red_cnts = cv2.findContours(red_mask.copy(), cv2.RETR_EXTERNAL,
-            cv2.CHAIN_APPROX_SIMPLE)[-2]
-        green_center = None
-        red_center = None
-
-        if len(green_cnts) > 0:
-            # find the largest contour in the mask, then use
-            # it to compute the minimum enclosing circle and
-            # centroid
-            c = max(green_cnts, key=cv2.contourArea)
-            ((x, y), radius) = cv2.minEnclosingCircle(c)
-            M = cv2.moments(c)
-            if "m00" in M and M["m00"] > 0:
-                green_center = (int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"]))
-            else:
-                green_center = (x,y)
-            
-            # only proceed if the radius meets a minimum size
-            if radius > 5:
-                # draw the circle and centroid on the frame,
-                cv2.circle(frame, (int(x), int(y)), int(self.hit_radius_px),
-                        (0, 255, 255), 2)
-                #cv2.circle(frame, green_center, 5, (0, 0, 255), -1)
-        
-        if len(red_cnts) > 0:
-            # find the largest contour in the mask, then use
-            # it to compute the minimum enclosing circle and
-            # centroid
-            c = max(red_cnts, key=cv2.contourArea)
-            ((x, y), radius) = cv2.minEnclosingCircle(c)
-            M = cv2.moments(c)
-            if "m00" in M and M["m00"] > 0:
-                red_center = (int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"]))
-            else:
-                red_center = (x,y)
+    '''
+    The IoT thing to move and the trace ID ride along to the fulfilment
+    Lambda as request attributes
+    '''
+    def lex_attributes(self, thing=None, trace_id=None):
+        lexAttributes = {}
+        if thing is not None:
+            lexAttributes['thing'] = thing
+        if trace_id is not None:
+            lexAttributes['trace_id'] = trace_id
+        return lexAttributes
+
+    '''
+    Post the command's text to Lex, which needs no speech recognition and
+    gives the fulfilment Lambda the same intent as the spoken command
+    '''
+    def send_text_to_lex(self, lex_client, text, botName='testing', botAlias='test_alias', userId='targetingDefault',
+                         thing=None, trace_id=None):
+        start = time.time()
+        self.trace(trace_id, 'lex_sent')
+        lex_resp = lex_client.post_text(botName=botName, botAlias=botAlias, userId=userId, inputText=text,
+                                        requestAttributes=self.lex_attributes(thing, trace_id))
+        self.trace(trace_id, 'lex_response', dialog_state=lex_resp.get('dialogState'))
+        print("Posted text to Lex in " + str(time.time() - start) + " seconds")
+        if lex_resp['dialogState'] == 'ElicitIntent':
+            print('Lex failed to parse command: ' + text + '\nResponse: ' + str(lex_resp))
+
+    '''
+    Move the head straight through its IoT shadow
+    '''
+    def send_to_shadow(self, text, thing, trace_id=None):
+        start = time.time()
+        direction, amount = parse_command(text)
+        if direction is None:
+            print("Not a move command: " + text)
+            return
+        self.mover.move(thing, direction, amount, trace_id)
+        self.trace(trace_id, 'shadow_update_sent', direction=direction)
+        print("Updated the shadow of " + thing + " in " + str(time.time() - start) + " seconds")
+
+    '''
+    Deliver a command's intent to the head over the configured path, or the
+    given one
+    '''
+    def deliver(self, polly, lex, command, head, trace_id=None, path=None):
+        path = path if path is not None else self.command_path
+        if path == 'shadow':
+            self.send_to_shadow(command, head.thing, trace_id)
+        elif path == 'text':
+            self.send_text_to_lex(lex, command, userId=head.user_id, thing=head.thing, trace_id=trace_id)
+        else:
+            self.send_to_lex(polly, lex, command, userId=head.user_id, thing=head.thing, trace_id=trace_id)
+
+    '''
+    Find the laser and the lit LED with the configured detector.
+    Returns (red_center, red_radius, green_center, green_radius).
+    '''
+    def locate(self, frame):
+        find_target = self.led_map is None
+        if self.detector is not None:
+            located = self.detector.locate(frame, find_target)
+        else:
+            located = find_laser_and_target(frame, find_target, self.ranges)
+        return self.apply_led_map(frame, located)
 
-            # only proceed if the radius meets a minimum size
-            if radius > 5:
-                # draw the circle and centroid on the frame,
-                #cv2.circle(frame, (int(x), int(y)), int(radius),
-                #        (0, 255, 255), 2)
-                cv2.circle(frame, red_center, 5, (0, 0, 255), -1)
+    def apply_led_map(self, frame, located):
+        if self.led_map is None:
+            return located
+        green_center, green_radius = self.led_map.lookup(self.heads[0].lit_gpio_pin, frame)
+        return located[0], located[1], green_center, green_radius
 
+    '''
+    Show the frame with the located laser and target drawn on it, and pass it
+    on to the debug stream. Does nothing when headless without a stream.
+    '''
+    def annotate(self, frame, located):
+        if self.debug_stream is not None:
+            self.debug_stream.offer(frame, located)
+        if self.headless:
+            return
+        if self.capture_format == 'yuv':
+            frame = self.detector.to_bgr(frame)
+        self.draw(frame, located)
         cv2.imshow('frame',frame)
-        
+
+    '''
+    Draw the located laser and target on a BGR frame
+    '''
+    def draw(self, frame, located):
+        if isinstance(located, list):
+            # one per head
+            for head_located in located:
+                self.draw(frame, head_located)
+            return
+        red_center, red_radius, green_center, green_radius = located
+        # only draw if the radius meets a minimum size
+        if green_center is not None and green_radius > 5:
+            cv2.circle(frame, green_center, int(self.hit_radius_px),
+                    (0, 255, 255), 2)
+        if red_center is not None and red_radius > 5:
+            cv2.circle(frame, red_center, 5, (0, 0, 255), -1)
+
+    def difference(self, located, head=None):
+        red_center, red_radius, green_center, green_radius = located
+        head = head if head is not None else self.heads[0]
+        if head.history is not None:
+            now = self.frame_time if self.frame_time is not None else time.time()
+            head.history.push(now, red_center, green_center)
+            return head.history.difference(self.smoothing)
         diff = None
         if green_center is not None and red_center is not None:
             diff = np.subtract(red_center, green_center)
-        
         return diff
 
+    '''
+    Locate the laser and target, through the Kalman filters when enabled.
+    Detection is skipped in favour of the prediction when the filters allow.
+    '''
+    def track(self, frame):
+        if self.kalman is None:
+            return self.locate(frame)
+        now = time.time()
+        if self.kalman.can_skip(command_pending=now >= self.heads[0].next_command_time):
+            return self.kalman.predict(now)
+        return self.kalman.update(now, self.locate(frame))
+
+    def detect(self, frame):
+        located = self.track(frame)
+        # kept for tools that want the centroids as well as the difference
+        self.last_located = located
+        self.annotate(frame, located)
+        return self.difference(located)
+
+    '''
+    Locate every head's laser and target from one pass over the frame. With
+    an LED map, each head's target is the green blob nearest its lit LED's
+    mapped position. Returns the location difference per head.
+    '''
+    def detect_all(self, frame):
+        expected = None
+        if self.led_map is not None:
+            expected = [self.led_map.position(head.lit_gpio_pin) for head in self.heads]
+        located = self.multi_detector.locate(frame, target_positions=expected)
+        self.last_located = located[0]
+        self.annotate(frame, located)
+        return [self.difference(l, head) for l, head in zip(located, self.heads)]
+
+    '''
+    Decide whether to dictate a command based on the latest difference in
+    location between the laser and the target, and dictate it. Returns the
+    command dictated, if any.
+    '''
+    def handle_difference(self, location_difference, polly, lex, head=None):
+        head = head if head is not None else self.heads[0]
+        t = stage_timing.timer.mark()
+        if location_difference is None and head.last_difference is not None:
+            self.black_box_event('lost_lock')
+        head.last_difference = location_difference
+        self.check_motion(location_difference, head)
+        command = self.decide(location_difference, head)
+        t = stage_timing.timer.record('decision', t)
+        if command is not None:
+            trace_id = new_trace_id() if self.tracer is not None else None
+            self.trace(trace_id, 'frame', t=self.frame_time, command=command, head=head.name)
+            self.trace(trace_id, 'decided')
+            if self.dispatcher is not None:
+                # a newer command for this head replaces this one if it is still waiting
+                self.dispatcher.submit(head.name, command, polly, lex, trace_id, head)
+            else:
+                self.dispatch(command, polly, lex, trace_id, head)
+            stage_timing.timer.record('dispatch', t)
+            
+            head.next_command_time = time.time() + self.command_interval
+            head.prev_loc_diff = location_difference
+            if trace_id is not None:
+                head.awaiting_motion = (trace_id, location_difference)
+        return command
+
+    '''
+    Act on the location difference of every head. Returns whether any of them
+    dictated a command.
+    '''
+    def handle_differences(self, location_differences, polly, lex):
+        commanded = False
+        for head, location_difference in zip(self.heads, location_differences):
+            if self.handle_difference(location_difference, polly, lex, head) is not None:
+                commanded = True
+        return commanded
+
+    def black_box_event(self, event):
+        if self.black_box is not None:
+            self.black_box.trigger(event)
+
+    def black_box_record(self, frame, located):
+        if self.black_box is not None:
+            self.black_box.record(frame, located, self.heads[0].last_difference, self.frame_time)
+
+    def trace(self, trace_id, hop, **extra):
+        if self.tracer is not None:
+            self.tracer.hop(trace_id, hop, **extra)
+
+    '''
+    Close the trace of the last command once the laser has visibly moved
+    '''
+    def check_motion(self, location_difference, head):
+        if head.awaiting_motion is None or location_difference is None:
+            return
+        trace_id, commanded_difference = head.awaiting_motion
+        if abs(location_difference[0] - commanded_difference[0]) > 15 \
+           or abs(location_difference[1] - commanded_difference[1]) > 15:
+            self.trace(trace_id, 'motion_observed', t=self.frame_time)
+            head.awaiting_motion = None
+
+    '''
+    Returns the command to dictate for a location difference, or None.
+    Lights a new target when the head's laser has hit the current one.
+    '''
+    def decide(self, location_difference, head=None):
+        head = head if head is not None else self.heads[0]
+        if location_difference is not None:
+            laser_moved = abs(location_difference[0] - head.prev_loc_diff[0]) > 15 \
+               or abs(location_difference[1] - head.prev_loc_diff[1]) > 15
+            
+            # If the laser hasn't moved since our last command, give it time to do so
+            if not laser_moved:
+                if not head.reported_unmoved:
+                    print(head.name + ' laser hasn\'t moved enough to dictate a new command')
+                    head.reported_unmoved = True
+            # Speak commands every N seconds
+            elif time.time() > head.next_command_time:
+                head.reported_unmoved = False
+                print(head.name + " location difference is " + str(location_difference))
+                command = None
+                if abs(location_difference[0]) < self.hit_radius_px and abs(location_difference[1]) < self.hit_radius_px:
+                    #command = "move reset"
+                    print("HIT TARGET!")
+                    self.black_box_event('hit')
+                    new_led = random.choice(head.pins)
+                    while new_led == head.lit_gpio_pin and len(head.pins) > 1:
+                        new_led = random.choice(head.pins)
+                    self.set_led(head.lit_gpio_pin, False)
+                    self.set_led(new_led, True)
+                    head.lit_gpio_pin = new_led
+                    # the new target is somewhere else in the frame
+                    if self.multi_detector is not None:
+                        self.multi_detector.forget_target(self.heads.index(head))
+                    elif self.detector is not None:
+                        self.detector.forget_target()
+                    if self.kalman is not None:
+                        self.kalman.forget_target()
+                    if head.history is not None:
+                        head.history.forget_target()
+                    return None
+                elif abs(location_difference[0]) > abs(location_difference[1]):
+                    # Seems to be ~7px per degree of movement of the pan-tilt
+                    units = int(abs(location_difference[0]) / 7)
+                    units = str(units)
+                    if location_difference[0] > 0:
+                        #command = "move left " + units
+                        command = "move left"
+                    else:
+                        #command = "move right " + units
+                        command = "move right"
+                else:
+                    # Seems to be ~7px per degree of movement of the pan-tilt
+                    units = int(abs(location_difference[1]) / 7)
+                    units = str(units)
+                    if location_difference[1] > 0:
+                        #command = "move up " + units
+                        command = "move up"
+                    else:
+                        #command = "move down " + units
+                        command = "move down"
+                
+                print(command)
+                return command
+        return None
+
+    '''
+    A command was dropped before it was dictated, so the head's laser won't
+    move for it. Forget it was sent so the head can be commanded again.
+    '''
+    def command_expired(self, command, polly, lex, trace_id=None, head=None):
+        head = head if head is not None else self.heads[0]
+        print(head.name + " command expired before it was dictated: " + command)
+        self.trace(trace_id, 'expired')
+        if self.dispatcher is not None and self.dispatcher.waiting(head.name):
+            # a newer command for the head is on its way
+            return
+        head.prev_loc_diff = [0,0]
+        head.next_command_time = 0
+        head.reported_unmoved = False
+        if head.awaiting_motion is not None and head.awaiting_motion[0] == trace_id:
+            head.awaiting_motion = None
+
+    '''
+    Dictate a command to the speaker and deliver it to the head, through the
+    head's Lex session or its shadow
+    '''
+    def dispatch(self, command, polly, lex, trace_id=None, head=None):
+        head = head if head is not None else self.heads[0]
+        self.trace(trace_id, 'dequeued')
+        deliver_thread = threading.Thread(target=self.deliver, args=(polly, lex, command, head, trace_id))
+        deliver_thread.start()
+        if self.speak_commands:
+            polly_thread = threading.Thread(target=self.speak, args=(polly, command))
+            polly_thread.start()
+            polly_thread.join()
+        deliver_thread.join()
+        #self.speak(polly, command)
+        #self.send_to_lex(polly_client=polly, lex_client=lex, text=command)
+
+    '''
+    Open the configured frame source, to be used as a context manager
+    '''
+    def open_source(self):
+        return open_frame_source(self.source, self.resolution, self.framerate, self.device,
+                                 self.replay_path, self.capture_format)
+
+    '''
+    Generate frames from a source, BGR by default or flat YUV420 buffers for
+    the yuv detector. With threaded capture the frames come from a pool of
+    preallocated buffers filled on a background thread and stale frames are
+    dropped; otherwise they are captured on this thread. Every frame is also
+    recorded when a recording path was given.
+    '''
+    def frames(self, source):
+        recorder = FrameRecorder(self.record_path).start() if self.record_path is not None else None
+        try:
+            for frame in self.capture_frames(source):
+                if recorder is not None:
+                    recorder.record(frame)
+                yield frame
+        finally:
+            if recorder is not None:
+                recorder.close()
+
+    def capture_frames(self, source):
+        if self.threaded_capture:
+            capture = ThreadedCapture(source.capture_sequence, source.frame_shape(), self.capture_pool_size)
+            self.capture = capture.start()
+            try:
+                while True:
+                    image_array = capture.read()
+                    if image_array is None:
+                        break
+                    yield image_array
+            finally:
+                capture.stop()
+                print("Capture stats: " + str(capture.stats()))
+        else:
+            for frame in source.frames():
+                yield frame
+
     def run(self):
         #initialize polly connection
         polly = self.connectToPolly()
         lex = self.connectToLex()
         
-        #turn on a random target light
-        self.lit_gpio_pin = random.choice(self.gpio_pins)
-        gpio.output(self.lit_gpio_pin, gpio.HIGH)
+        for head in self.heads:
+            head.lit_gpio_pin = random.choice(head.pins)
+        
+        if self.command_path == 'shadow':
+            self.mover = ShadowMover(self.step_amount, self.connectToIot())
+        
+        if self.speak_commands or self.command_path == 'audio':
+            # fetch the audio of every command before the first one is needed
+            fetched = self.speech_cache.prewarm(polly, [(command, 'Joanna', 'pcm', SAMPLE_RATE) for command in COMMANDS])
+            print("Prewarmed " + str(fetched) + " speech clips")
+        if self.speak_commands:
+            self.player = AudioPlayer(SAMPLE_RATE).start()
+        
+        # commands that waited through two command intervals are out of date
+        self.dispatcher = CommandDispatcher(self.dispatch, max_age=2 * self.command_interval,
+                                            on_expired=self.command_expired).start()
         
-        # initialize the camera and grab a reference to the raw camera capture
-        # with-block ensures camera.close() is called upon exit.
-        #with PiCamera(resolution = (1280, 960),framerate = 15) as camera:
-        with PiCamera(resolution = (1280, 960),framerate = 15) as camera:
+        if self.cameras:
+            return self.run_cameras(polly, lex)
+        
+        # initialize the frame source
+        # with-block ensures it is closed upon exit.
+        with self.open_source() as source:
+            frames = self.frames(source)
+            if self.parallel is not None:
+                self.parallel.start()
+            if self.debug_stream is not None:
+                self.debug_stream.start()
+            if self.black_box is not None:
+                self.black_box.start()
+            governor = None
+            if self.motion_gate is not None:
+                governor = FrameRateGovernor(source, self.framerate, self.idle_fps, self.idle_after)
             try:
-                # allow the camera to warmup
-                time.sleep(0.1)
-                rawCapture = PiRGBArray(camera, size=(1280, 960))
+                # find each LED once before lighting the target
+                if self.led_map is not None and gpio is not None and \
+                        (self.calibrate_leds or not self.led_map.has_all(self.gpio_pins)):
+                    self.led_map.calibrate(gpio, self.gpio_pins, source.grab)
                 
-                # initialize the next time to dictate a command to now
-                next_command_time = time.time()
-                prev_loc_diff = [0,0]
-                # capture frames from the camera
-                for frame in camera.capture_continuous(rawCapture, format="bgr", use_video_port=True):
-                    # grab the raw NumPy array representing the image
-                    image_array = frame.array
-
-                    # show the frame, detect shapes, and calculate difference in locations
-                    # between laser and target.
-                    location_difference = self.detect(image_array)
+                #turn on a random target light for each head
+                for head in self.heads:
+                    self.set_led(head.lit_gpio_pin, True)
                     
-                    if location_difference is not None:
-                        laser_moved = abs(location_difference[0] - prev_loc_diff[0]) > 15 \
-                           or abs(location_difference[1] - prev_loc_diff[1]) > 15
-                        
-                        # If the laser hasn't moved since our last command, give it time to do so
-                        if not laser_moved:
-                            print('laser hasn\'t moved enough to dictate a new command')
-                        # Speak commands every N seconds
-                        elif time.time() > next_command_time:
-                            print("Location difference is " + str(location_difference))
-                            command = None
-                            if abs(location_difference[0]) < self.hit_radius_px and abs(location_difference[1]) < self.hit_radius_px:
-                                #command = "move reset"
-                                print("HIT TARGET!")
-                                new_led = random.choice(self.gpio_pins)
-                                while new_led == self.lit_gpio_pin:
-                                    new_led = random.choice(self.gpio_pins)
-                                gpio.output(self.lit_gpio_pin, gpio.LOW)
-                                gpio.output(new_led, gpio.HIGH)
-                                self.lit_gpio_pin = new_led
-                                rawCapture.truncate(0)
-                                continue
-                            elif abs(location_difference[0]) > abs(location_difference[1]):
-                                # Seems to be ~7px per degree of movement of the pan-tilt
-                                units = int(abs(location_difference[0]) / 7)
-                                units = str(units)
-                                if location_difference[0] > 0:
-                                    #command = "move left " + units
-                                    command = "move left"
-                                else:
-                                    #command = "move right " + units
-                                    command = "move right"
-                            else:
-                                # Seems to be ~7px per degree of movement of the pan-tilt
-                                units = int(abs(location_difference[1]) / 7)
-                                units = str(units)
-                                if location_difference[1] > 0:
-                                    #command = "move up " + units
-                                    command = "move up"
-                                else:
-                                    #command = "move down " + units
-                                    command = "move down"
-                            
-                            print(command)
-                            polly_thread = threading.Thread(target=self.speak, args=(polly, command))
-                            lex_thread = threading.Thread(target=self.send_to_lex, args=(polly, lex, command))
-                            polly_thread.start()
-                            lex_thread.start()
-                            polly_thread.join()
-                            lex_thread.join()
-                            #self.speak(polly, command)
-                            #self.send_to_lex(polly_client=polly, lex_client=lex, text=command)
-                            
-                            next_command_time = time.time() + self.command_interval
-                            prev_loc_diff = location_difference
-             
-                    # clear the stream in preparation for the next frame
-                    rawCapture.truncate(0)
+                    # initialize the next time to dictate a command to now
+                    head.next_command_time = time.time()
+                    head.prev_loc_diff = [0,0]
+                # capture frames from the camera
+                t = stage_timing.timer.mark()
+                for image_array in frames:
+                    stage_timing.timer.record('capture_wait', t)
+                    self.frame_time = time.time()
+                    commanded = False
+                    if self.motion_gate is not None and not self.motion_gate.changed(image_array, self.frame_time):
+                        # nothing moved, so the last detection still stands
+                        commanded = self.handle_differences([head.last_difference for head in self.heads], polly, lex)
+                        self.black_box_record(image_array, self.last_located)
+                    elif self.parallel is not None:
+                        cpu_start = cpu_time()
+                        # hand the frame to the worker processes and act on
+                        # whichever earlier frames have finished, in order
+                        self.parallel.submit(image_array, find_target=self.led_map is None)
+                        for seq, frame, located in self.parallel.ready():
+                            located = self.apply_led_map(frame, located)
+                            if self.kalman is not None:
+                                located = self.kalman.update(time.time(), located)
+                            self.annotate(frame, located)
+                            if self.handle_difference(self.difference(located), polly, lex) is not None:
+                                commanded = True
+                            self.last_located = located
+                            self.black_box_record(frame, located)
+                            self.parallel.release(seq)
+                        if self.motion_gate is not None:
+                            self.motion_gate.processed_frame(cpu_start)
+                    elif self.multi_detector is not None:
+                        cpu_start = cpu_time()
+                        commanded = self.handle_differences(self.detect_all(image_array), polly, lex)
+                        self.black_box_record(image_array, self.last_located)
+                        if self.motion_gate is not None:
+                            self.motion_gate.processed_frame(cpu_start)
+                    else:
+                        cpu_start = cpu_time()
+                        # show the frame, detect shapes, and calculate difference in locations
+                        # between laser and target.
+                        location_difference = self.detect(image_array)
+                        commanded = self.handle_difference(location_difference, polly, lex) is not None
+                        self.black_box_record(image_array, self.last_located)
+                        if self.motion_gate is not None:
+                            self.motion_gate.processed_frame(cpu_start)
                     
-                    key = cv2.waitKey(10) & 0xFF
-                    # if the `q` key was pressed in a cv2 window, break from the loop
-                    if key == ord("q"):
-                        gpio.output(self.lit_gpio_pin, gpio.LOW)
-                        break
+                    if governor is not None:
+                        governor.update(self.frame_time, self.motion_gate.moved, commanded)
+                        self.motion_gate.maybe_report(governor)
+                    stage_timing.timer.maybe_dump()
+                    if not self.headless:
+                        key = cv2.waitKey(10) & 0xFF
+                        # if the `q` key was pressed in a cv2 window, break from the loop
+                        if key == ord("q"):
+                            break
+                    t = stage_timing.timer.mark()
             finally:
-                gpio.output(self.lit_gpio_pin, gpio.LOW)
-                cv2.destroyAllWindows()
+                frames.close()
+                self.stop_commands()
+                if self.parallel is not None:
+                    self.parallel.stop()
+                    print("Parallel detection stats: " + str(self.parallel.stats()))
+                if self.debug_stream is not None:
+                    self.debug_stream.stop()
+                if self.black_box is not None:
+                    self.black_box.stop()
+                    print("Black box stats: " + str(self.black_box.stats()))
+                for head in self.heads:
+                    self.set_led(head.lit_gpio_pin, False)
+                if not self.headless:
+                    cv2.destroyAllWindows()
+                if self.detector_mode == 'roi':
+                    print("ROI tracking stats: " + str(self.detector.stats()))
+                if self.kalman is not None:
+                    print("Kalman tracking stats: " + str(self.kalman.stats()))
+                if self.motion_gate is not None:
+                    print("Motion gate stats: " + str(self.motion_gate.stats()))
+                stage_timing.timer.dump()
+                if self.tracer is not None:
+                    self.tracer.close()
+
+
+    '''
+    Let the command being dictated finish, drop any still waiting, close the
+    sound card and save the speech cache's manifest
+    '''
+    def stop_commands(self):
+        if self.dispatcher is not None:
+            self.dispatcher.stop()
+            print("Command dispatcher stats: " + str(self.dispatcher.stats()))
+            self.dispatcher = None
+        if self.player is not None:
+            self.player.stop()
+            print("Audio player stats: " + str(self.player.stats()))
+            self.player = None
+        self.speech_cache.close()
+        print("Speech cache stats: " + str(self.speech_cache.stats()))
+
+    '''
+    Steer the laser from the fused detections of several cameras, each
+    captured and searched in its own process
+    '''
+    def run_cameras(self, polly, lex):
+        head = self.heads[0]
+        fusion = CameraFusion(self.cameras, self.resolution, self.framerate, self.thresholds,
+                              self.lut_cache_dir).start()
+        try:
+            self.set_led(head.lit_gpio_pin, True)
+            head.next_command_time = time.time()
+            head.prev_loc_diff = [0,0]
+            for frame_time, located in fusion.updates():
+                self.frame_time = frame_time
+                self.last_located = located
+                self.handle_difference(self.difference(located), polly, lex)
+                stage_timing.timer.maybe_dump()
+        finally:
+            fusion.stop()
+            print("Camera stats: " + str(fusion.stats()))
+            self.stop_commands()
+            self.set_led(head.lit_gpio_pin, False)
+            stage_timing.timer.dump()
+            if self.tracer is not None:
+                self.tracer.close()
 
 
 if __name__ == '__main__':
-    tracker = LaserTracker()
+    parser = argparse.ArgumentParser(description='Track a laser pointer and dictate commands toward a target LED.')
+    parser.add_argument('--detector', dest='detector_mode', default='full',
+                        choices=['full', 'roi', 'pyramid', 'yuv', 'lut'],
+                        help='Laser/LED detection strategy.')
+    parser.add_argument('--roi-window', dest='roi_window_px', type=int, default=160,
+                        help='Half-size of the ROI search window in pixels.')
+    parser.add_argument('--led-map', dest='led_map_path',
+                        help='Look up target LED positions in this JSON map instead of detecting them every frame.')
+    parser.add_argument('--calibrate-leds', dest='calibrate_leds', action='store_true',
+                        help='Re-locate every LED at startup and rewrite the LED map.')
+    parser.add_argument('--threaded-capture', dest='threaded_capture', action='store_true',
+                        help='Capture frames on a background thread and always process the newest one.')
+    parser.add_argument('--capture-pool', dest='capture_pool_size', type=int, default=3,
+                        help='Number of preallocated frame buffers used by threaded capture.')
+    parser.add_argument('--workers', dest='parallel_workers', type=int, default=0,
+                        help='Run detection in this many worker processes (0 detects on the main thread).')
+    parser.add_argument('--parallel-mode', dest='parallel_mode', default='round-robin',
+                        choices=['round-robin', 'split'],
+                        help='Spread whole frames over the workers, or split red and green detection.')
+    parser.add_argument('--headless', dest='headless', action='store_true',
+                        help='Skip all drawing and GUI calls. Stop with Ctrl-C.')
+    parser.add_argument('--debug-port', dest='debug_port', type=int,
+                        help='Serve an MJPEG stream of annotated frames on this port.')
+    parser.add_argument('--debug-fps', dest='debug_fps', type=float, default=2.0,
+                        help='Maximum frame rate of the debug stream.')
+    parser.add_argument('--thresholds', dest='thresholds_path',
+                        help='HSV ranges saved by range-detector --output or hsv_calibration.py, which also '
+                             'saves the YUV bounds the yuv detector needs.')
+    parser.add_argument('--profile', dest='profile',
+                        help='Use the HSV ranges and YUV bounds of this profile saved by hsv_calibration.py.')
+    parser.add_argument('--profile-dir', dest='profile_dir', default='hsv_profiles',
+                        help='Directory the HSV profiles are stored in.')
+    parser.add_argument('--lut-cache', dest='lut_cache_dir', default='.',
+                        help='Directory the colour lookup tables are cached in.')
+    parser.add_argument('--kalman', dest='kalman', action='store_true',
+                        help='Smooth centroids with Kalman filters and skip detection on well predicted frames.')
+    parser.add_argument('--max-skip', dest='max_skip', type=int, default=2,
+                        help='Most consecutive frames the Kalman prediction may stand in for detection.')
+    parser.add_argument('--source', dest='source', default='picamera',
+                        choices=['picamera', 'v4l2', 'replay'],
+                        help='Where frames come from.')
+    parser.add_argument('--device', dest='device', type=int, default=0,
+                        help='cv2.VideoCapture device index for the v4l2 source.')
+    parser.add_argument('--replay', dest='replay_path',
+                        help='Recorded session to replay with the replay source.')
+    parser.add_argument('--record', dest='record_path',
+                        help='Record every frame with its timestamp to this .npz file.')
+    parser.add_argument('--timing', dest='timing', action='store_true',
+                        help='Record per-stage timing histograms and print them periodically and on exit.')
+    parser.add_argument('--timing-interval', dest='timing_interval', type=float, default=60.0,
+                        help='Seconds between timing dumps, 0 to only dump on exit.')
+    parser.add_argument('--timing-output', dest='timing_output',
+                        help='Also write each timing dump to this JSON file.')
+    parser.add_argument('--trace-log', dest='trace_log',
+                        help='Append end-to-end latency trace hops for every command to this file.')
+    parser.add_argument('--motion-gate', dest='motion_gate', action='store_true',
+                        help='Skip detection on unchanged frames and lower the frame rate while idle.')
+    parser.add_argument('--idle-fps', dest='idle_fps', type=float, default=3,
+                        help='Frame rate to drop to while nothing changes, with --motion-gate.')
+    parser.add_argument('--idle-after', dest='idle_after', type=float, default=5.0,
+                        help='Seconds without change or commands before dropping to the idle frame rate.')
+    parser.add_argument('--smoothing', dest='smoothing', default='median',
+                        choices=['median', 'ema', 'none'],
+                        help='How recent centroids are combined before deciding on a command.')
+    parser.add_argument('--smoothing-window', dest='smoothing_window', type=int, default=5,
+                        help='Frames the median is taken over.')
+    parser.add_argument('--black-box', dest='black_box_dir',
+                        help='Keep the last seconds of downscaled frames and write them to this directory on a hit, lost lock or Lex retry.')
+    parser.add_argument('--black-box-seconds', dest='black_box_seconds', type=float, default=10.0,
+                        help='Seconds of frames the black box keeps.')
+    parser.add_argument('--head', dest='heads', action='append', default=[],
+                        help='A pan/tilt head as NAME:THING:PIN,PIN,... (its IoT thing and target LED pins). '
+                             'Repeat for several heads in front of one camera, listed left to right.')
+    parser.add_argument('--cameras', dest='cameras_path',
+                        help='JSON list of cameras to detect on, a process each, fused into one view.')
+    parser.add_argument('--command-path', dest='command_path', default='audio', choices=['audio', 'text', 'shadow'],
+                        help='How commands reach the head: spoken to Lex, as text to Lex, or straight to its IoT shadow.')
+    parser.add_argument('--silent', dest='speak', action='store_false',
+                        help='Don\'t speak commands aloud.')
+    parser.add_argument('--step', dest='step_amount', type=int, default=10,
+                        help='How far the shadow path moves the head per command, as the Lambda\'s default_step_amount.')
+    parser.add_argument('--speech-cache', dest='speech_cache_dir', default='speech_cache',
+                        help='Directory Polly audio is cached in.')
+    parser.add_argument('--speech-cache-mb', dest='speech_cache_mb', type=float, default=50,
+                        help='Size the speech cache is kept under, least recently used clips first out.')
+    args = parser.parse_args()
+    if args.profile is not None:
+        args.thresholds_path = profile_path(args.profile, args.profile_dir)
+        if not os.path.isfile(args.thresholds_path):
+            parser.error("No HSV profile " + args.thresholds_path + ", run hsv_calibration.py " + args.profile + " first")
+
+    if args.timing:
+        stage_timing.enable(args.timing_interval or None, args.timing_output)
+
+    tracker = LaserTracker(detector_mode=args.detector_mode, roi_window_px=args.roi_window_px,
+                           led_map_path=args.led_map_path, calibrate_leds=args.calibrate_leds,
+                           threaded_capture=args.threaded_capture, capture_pool_size=args.capture_pool_size,
+                           parallel_workers=args.parallel_workers, parallel_mode=args.parallel_mode,
+                           headless=args.headless, debug_port=args.debug_port, debug_fps=args.debug_fps,
+                           thresholds_path=args.thresholds_path, lut_cache_dir=args.lut_cache_dir,
+                           kalman=args.kalman, max_skip=args.max_skip,
+                           source=args.source, device=args.device, replay_path=args.replay_path,
+                           record_path=args.record_path, trace_log=args.trace_log,
+                           motion_gate=args.motion_gate, idle_fps=args.idle_fps, idle_after=args.idle_after,
+                           smoothing=args.smoothing, smoothing_window=args.smoothing_window,
+                           black_box_dir=args.black_box_dir, black_box_seconds=args.black_box_seconds,
+                           heads=[Head.parse(spec) for spec in args.heads],
+                           cameras=load_cameras(args.cameras_path) if args.cameras_path else None,
+                           speech_cache_dir=args.speech_cache_dir, speech_cache_mb=args.speech_cache_mb,
+                           command_path=args.command_path, speak=args.speak, step_amount=args.step_amount)
     tracker.run()
@@ -47,7 +47,7 @@ class MovementClient:
             raise RuntimeError("Unexpected error with boto")
 
 
-    def _update_desired(self,x,y):
+    def _update_desired(self,x,y,trace_id=None):
         shadow = {
             'state': {
                 'desired': {
@@ -57,30 +57,32 @@ class MovementClient:
             }
 
         }
+        if trace_id is not None:
+            shadow['state']['desired']['trace_id'] = trace_id
         response = self.client.update_thing_shadow(
             thingName=self.thing_name,
             payload=json.dumps(shadow)
         )
 
 
-    def move_up(self, ydelta):
+    def move_up(self, ydelta, trace_id=None):
         x,y = self._get_current_coordinates()
         y=y+ydelta
-        self._update_desired(x,y)
+        self._update_desired(x,y,trace_id)
 
-    def move_down(self, ydelta):
+    def move_down(self, ydelta, trace_id=None):
         x,y = self._get_current_coordinates()
         y=y-ydelta
-        self._update_desired(x,y)
+        self._update_desired(x,y,trace_id)
 
-    def move_left(self, xdelta):
+    def move_left(self, xdelta, trace_id=None):
         x,y = self._get_current_coordinates()
         x=x-xdelta
-        self._update_desired(x,y)
+        self._update_desired(x,y,trace_id)
 
-    def move_right(self, xdelta):
+    def move_right(self, xdelta, trace_id=None):
         x,y = self._get_current_coordinates()
         x=x+xdelta
-        self._update_desired(x,y)
+        self._update_desired(x,y,trace_id)
 
 
@@ -3,12 +3,23 @@ import boto3
 import logging
 import traceback
 import os
+import time
 from botocore.exceptions import ClientError
 
 logging.basicConfig()
 log = logging.getLogger()
 log.setLevel(logging.INFO)
 
+def trace(trace_id, hop, **extra):
+    """Log a latency trace hop in the format latency_report.py reads."""
+    if trace_id is None:
+        return
+    record = dict(extra)
+    record['trace_id'] = trace_id
+    record['hop'] = hop
+    record['t'] = time.time()
+    log.info('TRACE ' + json.dumps(record, sort_keys=True))
+
 class MovementClient:
 
     thing_name = None
@@ -49,7 +60,7 @@ class MovementClient:
             raise RuntimeError("Unexpected error with boto: " + traceback.format_exc())
 
 
-    def _update_desired(self,x,y):
+    def _update_desired(self,x,y,trace_id=None):
         shadow = {
             'state': {
                 'desired': {
@@ -59,36 +70,41 @@ class MovementClient:
             }
 
         }
+        if trace_id is not None:
+            shadow['state']['desired']['trace_id'] = trace_id
         response = self.client.update_thing_shadow(
             thingName=self.thing_name,
             payload=json.dumps(shadow)
         )
 
 
-    def move_up(self, ydelta):
+    def move_up(self, ydelta, trace_id=None):
         x,y = self._get_current_coordinates()
         y=y-ydelta
-        self._update_desired(x,y)
+        self._update_desired(x,y,trace_id)
 
-    def move_down(self, ydelta):
+    def move_down(self, ydelta, trace_id=None):
         x,y = self._get_current_coordinates()
         y=y+ydelta
-        self._update_desired(x,y)
+        self._update_desired(x,y,trace_id)
 
-    def move_left(self, xdelta):
+    def move_left(self, xdelta, trace_id=None):
         x,y = self._get_current_coordinates()
         x=x+xdelta
-        self._update_desired(x,y)
+        self._update_desired(x,y,trace_id)
 
-    def move_right(self, xdelta):
+    def move_right(self, xdelta, trace_id=None):
         x,y = self._get_current_coordinates()
         x=x-xdelta
-        self._update_desired(x,y)
+        self._update_desired(x,y,trace_id)
 
 def handler(event, context):
     try:
         """Lambda handler for sending command to IoT."""
         log.info('Handling event: %s' % event)
+        attributes = event.get('requestAttributes') or {}
+        trace_id = attributes.get('trace_id')
+        trace(trace_id, 'lambda_start')
         cmd = None
         delta = int(os.environ['default_step_amount']) if 'default_step_amount' in os.environ else 10
         
@@ -99,23 +115,25 @@ def handler(event, context):
             if 'Amount' in slots and not slots['Amount'] is None:
                 delta = int(slots['Amount'])
     
-        movement_client = MovementClient('lg_thing_0')
+        # each pan/tilt head in front of the camera is its own thing
+        movement_client = MovementClient(attributes.get('thing', 'lg_thing_0'))
     
         if (cmd=="up"):
             log.info('Moving up %s' % delta)
-            movement_client.move_up(delta)
+            movement_client.move_up(delta, trace_id)
         elif (cmd=="down"):
             log.info('Moving down %s' % delta)
-            movement_client.move_down(delta)
+            movement_client.move_down(delta, trace_id)
         elif (cmd=="left"):
             log.info('Moving left %s' % delta)
-            movement_client.move_left(delta)
+            movement_client.move_left(delta, trace_id)
         elif (cmd=="right"):
             log.info('Moving right %s' % delta)
-            movement_client.move_right(delta)
+            movement_client.move_right(delta, trace_id)
         else:
             log.warning('Unrecognized direction. Resetting laser to origin.')
-            movement_client._update_desired(0,0)
+            movement_client._update_desired(0,0,trace_id)
+        trace(trace_id, 'shadow_update_sent', direction=cmd)
         
         return {
         'dialogAction': {
@@ -34,6 +34,16 @@ AWS_IOT_MQTT_PORT = 8883
 
 make_string = lambda x: "".join(choice(lowercase) for i in range(x))
 
+def trace(trace_id, hop, **extra):
+    """Log a latency trace hop in the format latency_report.py reads."""
+    if trace_id is None:
+        return
+    record = dict(extra)
+    record['trace_id'] = trace_id
+    record['hop'] = hop
+    record['t'] = time.time()
+    log.info('TRACE ' + json.dumps(record, sort_keys=True))
+
 class LaserGuidanceThing:
 
     keep_running = True
@@ -143,10 +153,13 @@ class LaserGuidanceThing:
             message.payload, message.topic))
         shadow = json.loads(message.payload)
         if ("desired" in shadow["state"]):
+            trace_id = shadow["state"]["desired"].get("trace_id")
+            trace(trace_id, 'shadow_received')
             xdelta = shadow["state"]["desired"]["x"]-self.x
             ydelta = shadow["state"]["desired"]["y"]-self.y
             #move_guidance(xdelta,ydelta)
             move_guidance(shadow["state"]["desired"]["x"], shadow["state"]["desired"]["y"])
+            trace(trace_id, 'moved')
             self.x = self.x + xdelta
             self.y = self.y + ydelta
             publish_update_topic = publish_update_topic_name_template.format(self.thing_name)
@@ -159,6 +172,8 @@ class LaserGuidanceThing:
                 }
 
             }
+            if trace_id is not None:
+                shadow['state']['reported']['trace_id'] = trace_id
             self.mqttc.publish(publish_update_topic, json.dumps(shadow), 0)
 
 